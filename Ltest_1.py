@@ -1,35 +1,50 @@
-from zhipuai import ZhipuAI
-import time
-client = ZhipuAI(api_key="")
+import argparse
+import os
+import sys
 
+# 复用pet目录下的统一大模型客户端（连接复用、超时、重试、并发上限）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pet"))
+from llm_client import get_llm_client
+from dialogue_replay import stream_reply, print_token, load_dialogues, replay_dialogues
+
+# API Key 从环境变量 ZHIPU_API_KEY 读取
+client = get_llm_client()
+
+SYSTEM_PROMPT = "你是健康饮食专家"
+
+
+def build_messages(history, message):
+    # 每句话单独提问，不带历史
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": message},
+    ]
 
-def stream_ouput(stream_data):
-    for i in stream_data:
-        print(i,end='')
-        time.sleep(0.05)
-        
 def chat(message):
-    response = client.chat.completions.create(
-        model="glm-4",
-        messages=[
-            {"role": "system", "content": f"你是健康饮食专家"},
-            {"role": "user", "content": message},
-        ],
-    )
-    return response.choices[0].message.content
-
-stream_ouput("请输入你的专属AI名称：")
+    """流式请求，token到达即打印，返回完整回复"""
+    reply, _, _ = stream_reply(client, build_messages([], message), on_token=print_token)
+    return reply
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--batch", help="脚本化对话JSONL，每行 {\"id\": ..., \"turns\": [...]}，不进入交互模式")
+parser.add_argument("--out", default="transcripts_ltest1.jsonl", help="批量模式的对话记录输出文件")
+parser.add_argument("--workers", type=int, default=4, help="批量模式同时回放的对话数")
+args = parser.parse_args()
+
+if args.batch:
+    replay_dialogues(client, load_dialogues(args.batch), lambda: build_messages, args.out, args.workers)
+    sys.exit(0)
+
+print("请输入你的专属AI名称：", end='')
 n = input()
 
 
 while True:
-    stream_ouput(f'我是{n}，有什么可以帮到你的：')
+    print(f'我是{n}，有什么可以帮到你的：', end='')
     message = input()
     if(message == '再见'):
         print('bye')
         break
 
-    stream_ouput(chat(message))
+    chat(message)
     print('\n')
-
-
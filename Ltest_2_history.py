@@ -1,30 +1,42 @@
-from zhipuai import ZhipuAI
-import time
+import argparse
+import os
+import sys
 
-client = ZhipuAI(api_key="")
+# 复用pet目录下的统一大模型客户端和历史窗口管理
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pet"))
+from llm_client import get_llm_client
+from history_manager import HistoryWindow, llm_summarizer
+from dialogue_replay import stream_reply, print_token, load_dialogues, replay_dialogues
 
-def stream_output(stream_data):
-    for i in stream_data:
-        print(i, end='')
-        time.sleep(0.05)
+# API Key 从环境变量 ZHIPU_API_KEY 读取
+client = get_llm_client()
 
-def chat(messages_history):
-    response = client.chat.completions.create(
-        model="glm-4",
-        messages=messages_history,
-    )
-    return response.choices[0].message.content
+SYSTEM_PROMPT = "你是健康饮食专家"
 
-# 初始化对话历史
-conversation_history = [
-    {"role": "system", "content": "你是健康饮食专家"}
-]
+def make_history_builder():
+    """每段对话一个独立的历史窗口：最近的原文控制在token预算内，更早的折叠成摘要"""
+    history_window = HistoryWindow(token_budget=2000, summarize_fn=llm_summarizer(client))
+    return lambda history, message: history_window.to_messages(SYSTEM_PROMPT, history)
 
-stream_output("请输入你的专属AI名称：")
+parser = argparse.ArgumentParser()
+parser.add_argument("--batch", help="脚本化对话JSONL，每行 {\"id\": ..., \"turns\": [...]}，不进入交互模式")
+parser.add_argument("--out", default="transcripts_ltest2.jsonl", help="批量模式的对话记录输出文件")
+parser.add_argument("--workers", type=int, default=4, help="批量模式同时回放的对话数")
+args = parser.parse_args()
+
+if args.batch:
+    replay_dialogues(client, load_dialogues(args.batch), make_history_builder, args.out, args.workers)
+    sys.exit(0)
+
+# 初始化对话历史（只存用户和AI的消息，系统提示由历史窗口拼接）
+conversation_history = []
+build_messages = make_history_builder()
+
+print("请输入你的专属AI名称：", end='')
 n = input()
 
 while True:
-    stream_output(f'我是{n}，有什么可以帮到你的：')
+    print(f'我是{n}，有什么可以帮到你的：', end='')
     user_message = input()
     
     if user_message == '再见':
@@ -34,11 +46,9 @@ while True:
     # 将用户的输入添加到对话历史中
     conversation_history.append({"role": "user", "content": user_message})
     
-    # 获取AI的回复
-    ai_response = chat(conversation_history)
+    # 流式获取AI的回复，边生成边打印
+    ai_response, _, _ = stream_reply(client, build_messages(conversation_history, user_message), on_token=print_token)
     
     # 将AI的回复也添加到对话历史中
     conversation_history.append({"role": "assistant", "content": ai_response})
-    
-    stream_output(ai_response)
-    print('\n')
\ No newline at end of file
+    print('\n')
@@ -1,11 +1,46 @@
-import base64
-from zai import ZhipuAiClient
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
-def encode_image(image_path):
-    with open(image_path, 'rb') as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+# 复用pet目录下的图片预处理和统一大模型客户端
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pet"))
+from image_preprocess import preprocess_image_file, to_data_url
+from llm_client import get_llm_client, LLMClient, RateLimiter
 
-client = ZhipuAiClient(api_key="")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif")
+BATCH_PROMPT = "请描述这张图片里的动物：种类、品种、毛色和明显的外观特征，简洁分点输出。"
+
+def encode_image(image_path, max_edge=1024, quality=85):
+    """返回可直接放进image_url的data URL"""
+    prepared = preprocess_image_file(image_path, max_edge, quality)
+    print(f"图片预处理：{prepared['original_bytes']} → {prepared['encoded_bytes']} 字节（节省 {prepared['saved_bytes']} 字节）")
+    return to_data_url(prepared)
+
+def describe_image(client, image_data_url, prompt, model="glm-4.6v"):
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_data_url
+                        }
+                    }
+                ]
+            }
+        ]
+    )
+    return response.choices[0].message.content
 
 # # 方式1：使用图像URL
 # response = client.chat.completions.create(
@@ -31,28 +66,147 @@ client = ZhipuAiClient(api_key="")
 
 # print(response.choices[0].message.content)
 
-# 方式2：使用base64编码的图像
-base64_image = encode_image("D:\壁纸\夏天心.jpg")
-
-response = client.chat.completions.create(
-    model="glm-4.6v",
-    messages=[
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": "图片里的女生是哪国人？"
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"
-                    }
-                }
-            ]
-        }
-    ]
-)
+# ------------------------------
+# 批量模式：遍历目录，并发描述，结果逐条写入JSONL
+# ------------------------------
+def find_images(image_dir):
+    paths = []
+    for root, _, files in os.walk(image_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+def load_done_paths(output_path):
+    """断点续跑：输出文件里已经成功的图片不再重复请求"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 崩溃时可能留下半行，忽略即可
+                continue
+            if "description" in record:
+                done.add(record["path"])
+    return done
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def run_batch(image_dir, output_path, prompt, model, workers, encode_workers, rate, max_edge, quality):
+    # 共享客户端按(api_key, base_url)缓存，已存在时会忽略max_concurrency；批量任务单独建一个，--workers才生效
+    client = LLMClient(api_key=os.getenv("ZHIPU_API_KEY"), base_url=os.getenv("ZHIPU_BASE_URL") or None,
+                       max_concurrency=workers)
+    try:
+        limiter = RateLimiter(rate, burst=workers)
+        paths = find_images(image_dir)
+        done = load_done_paths(output_path)
+        todo = [p for p in paths if os.path.abspath(p) not in done]
+        print(f"共 {len(paths)} 张图片，已完成 {len(paths) - len(todo)} 张，本次处理 {len(todo)} 张")
+        if not todo:
+            return
+
+        def request(path, prepared):
+            limiter.acquire()
+            start = time.perf_counter()
+            description = describe_image(client, to_data_url(prepared), prompt, model)
+            return description, time.perf_counter() - start
+
+        latencies = []
+        failures = 0
+        batch_start = time.perf_counter()
+        # 编码是CPU密集型，放进程池；请求是IO密集型，放线程池并受令牌桶限速
+        # 编码中+请求中的图片总数不超过window，编码不会远远跑在限速的请求前面，内存只和window有关、和目录大小无关
+        window = max(2, 2 * workers)
+        todo_iter = iter(todo)
+        with ProcessPoolExecutor(max_workers=encode_workers) as encode_pool, \
+                ThreadPoolExecutor(max_workers=workers) as request_pool, \
+                open(output_path, 'a', encoding='utf-8') as out:
+            encode_futures = {}
+            request_futures = {}
+            pending = set()
+
+            def fill_window():
+                while len(pending) < window:
+                    path = next(todo_iter, None)
+                    if path is None:
+                        return
+                    future = encode_pool.submit(preprocess_image_file, path, max_edge, quality, False)
+                    encode_futures[future] = path
+                    pending.add(future)
+
+            fill_window()
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(finished)
+                for future in finished:
+                    if future in encode_futures:
+                        # 编码好一张就立刻提交请求，它在请求完成前继续占着窗口里的位置
+                        path = encode_futures.pop(future)
+                        try:
+                            prepared = future.result()
+                        except Exception as e:
+                            failures += 1
+                            out.write(json.dumps({"path": os.path.abspath(path), "error": f"编码失败：{e}"}, ensure_ascii=False) + "\n")
+                            continue
+                        request_future = request_pool.submit(request, path, prepared)
+                        request_futures[request_future] = (path, prepared["encoded_bytes"])
+                        pending.add(request_future)
+                        continue
+
+                    path, bytes_sent = request_futures.pop(future)
+                    record = {"path": os.path.abspath(path), "model": model, "bytes_sent": bytes_sent}
+                    try:
+                        record["description"], record["latency"] = future.result()
+                        latencies.append(record["latency"])
+                        status = f"{record['latency']:.2f}s"
+                    except Exception as e:
+                        failures += 1
+                        record["error"] = str(e)
+                        status = f"失败：{e}"
+                    # 每完成一张就落盘，崩溃后可以续跑
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    print(f"[{len(latencies) + failures}/{len(todo)}] {os.path.basename(path)} {status}")
+                fill_window()
+
+        elapsed = time.perf_counter() - batch_start
+        print(f"\n完成 {len(latencies)} 张，失败 {failures} 张，总耗时 {elapsed:.1f} 秒，吞吐 {len(latencies) / elapsed:.2f} 张/秒")
+        if latencies:
+            print(f"单张延迟：p50 {_percentile(latencies, 0.5):.2f}s  p95 {_percentile(latencies, 0.95):.2f}s  最大 {max(latencies):.2f}s")
+    finally:
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="用视觉模型描述图片，支持单张和整目录批量")
+    parser.add_argument("image", nargs="?", default="D:\\壁纸\\夏天心.jpg", help="单张图片路径")
+    parser.add_argument("--batch", metavar="DIR", help="批量模式：递归处理目录下所有图片")
+    parser.add_argument("--output", default="descriptions.jsonl", help="批量模式输出的JSONL文件（已有记录会跳过）")
+    parser.add_argument("--prompt", help="提问内容")
+    parser.add_argument("--model", default="glm-4.6v")
+    parser.add_argument("--workers", type=int, default=4, help="同时在途的请求数")
+    parser.add_argument("--encode-workers", type=int, default=os.cpu_count() or 2, help="图片编码进程数")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒最多发起的请求数，0表示不限速")
+    parser.add_argument("--max-edge", type=int, default=1024)
+    parser.add_argument("--quality", type=int, default=85)
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args.batch, args.output, args.prompt or BATCH_PROMPT, args.model,
+                  args.workers, args.encode_workers, args.rate, args.max_edge, args.quality)
+        return
+
+    # 方式2：使用base64编码的图像
+    # API Key 从环境变量 ZHIPU_API_KEY 读取
+    client = get_llm_client()
+    image_data_url = encode_image(args.image, args.max_edge, args.quality)
+    print(describe_image(client, image_data_url, args.prompt or "图片里的女生是哪国人？", args.model))
 
-print(response.choices[0].message.content)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
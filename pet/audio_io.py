@@ -0,0 +1,126 @@
+"""
+送给百度ASR的音频通路：
+- 麦克风录到的int16数组直接以memoryview交给ASR，不再经过WAV容器再切掉“44字节”头
+- WAV字节按RIFF块解析找到data块，额外的LIST等块不会被当成音频
+- 录音文件/音频流输入：解码后统一转成16kHz单声道int16
+"""
+import io
+import struct
+
+import numpy as np
+
+try:
+    from scipy.signal import resample_poly
+except ImportError:  # 没装scipy时用线性插值重采样
+    resample_poly = None
+
+ASR_SAMPLERATE = 16000
+
+
+def pcm_view(audio):
+    """int16单声道数组 -> 按字节的memoryview；数组本身连续时不发生任何拷贝"""
+    audio = np.ascontiguousarray(audio, dtype=np.int16).reshape(-1)
+    return memoryview(audio).cast('B')
+
+
+def parse_wav(data):
+    """
+    解析WAV字节，返回（采样率, 声道数, 位深, data块的memoryview）。
+    按块遍历而不是假设固定44字节头，遇到LIST/fact等额外块也能正确定位。
+    """
+    view = memoryview(data)
+    if len(view) < 12 or bytes(view[0:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise ValueError("不是有效的WAV数据")
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        size = struct.unpack_from("<I", view, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, samplerate = struct.unpack_from("<HHI", view, body)
+            bits = struct.unpack_from("<H", view, body + 14)[0]
+            fmt = (audio_format, channels, samplerate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV缺少fmt块")
+            if fmt[0] not in (1, 0xFFFE):
+                raise ValueError("只支持PCM编码的WAV")
+            # 录音中断时data块长度可能写成0或超长，以实际数据为准
+            end = len(view) if size == 0 or body + size > len(view) else body + size
+            return fmt[2], fmt[1], fmt[3], view[body:end]
+        # 块长度为奇数时有一个填充字节
+        pos = body + size + (size & 1)
+    raise ValueError("WAV缺少data块")
+
+
+def to_mono(audio):
+    if audio.ndim == 1:
+        return audio
+    return audio.mean(axis=1)
+
+
+def resample(audio, src_rate, dst_rate=ASR_SAMPLERATE):
+    """一维float数组重采样；采样率相同时原样返回"""
+    if src_rate == dst_rate or len(audio) == 0:
+        return audio
+    if resample_poly is not None:
+        g = np.gcd(int(src_rate), int(dst_rate))
+        return resample_poly(audio, dst_rate // g, src_rate // g)
+    duration = len(audio) / src_rate
+    dst_len = int(round(duration * dst_rate))
+    src_t = np.arange(len(audio)) / src_rate
+    dst_t = np.arange(dst_len) / dst_rate
+    return np.interp(dst_t, src_t, audio)
+
+
+def to_asr_pcm(audio, samplerate):
+    """任意采样率/声道/dtype的数组 -> 16kHz单声道int16；已是目标格式时不拷贝"""
+    audio = np.asarray(audio)
+    if samplerate == ASR_SAMPLERATE and audio.dtype == np.int16 and (audio.ndim == 1 or audio.shape[1] == 1):
+        return audio.reshape(-1)
+    if audio.dtype == np.int16:
+        audio = audio.astype(np.float32) / 32768.0
+    mono = resample(to_mono(audio.astype(np.float32, copy=False)), samplerate, ASR_SAMPLERATE)
+    return (np.clip(mono, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def load_audio(source):
+    """
+    文件输入模式：source可以是路径、bytes或文件对象（如Streamlit上传的文件）。
+    PCM编码的WAV直接解析，其余格式（flac/ogg等）交给soundfile解码。返回16kHz单声道int16数组。
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = source
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            data = f.read()
+    else:
+        data = source.read()
+    try:
+        samplerate, channels, bits, body = parse_wav(data)
+        if bits == 16:
+            audio = np.frombuffer(body[:len(body) // (2 * channels) * 2 * channels], dtype='<i2')
+            return to_asr_pcm(audio.reshape(-1, channels), samplerate)
+    except (ValueError, struct.error):
+        pass
+    import soundfile as sf
+    audio, samplerate = sf.read(io.BytesIO(bytes(data)), dtype='float32', always_2d=True)
+    return to_asr_pcm(audio, samplerate)
+
+
+def read_pcm_stream(stream, samplerate=ASR_SAMPLERATE, channels=1, chunk_bytes=64 * 1024):
+    """
+    流输入模式：从文件对象（如管道、sys.stdin.buffer）读取无头的int16 PCM直到结束，
+    读入预分配的缓冲区，最后按需重采样成16kHz单声道。
+    """
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(chunk_bytes)
+        if not chunk:
+            break
+        buffer += chunk
+    frame_bytes = 2 * channels
+    usable = len(buffer) - len(buffer) % frame_bytes
+    audio = np.frombuffer(memoryview(buffer)[:usable], dtype='<i2').reshape(-1, channels)
+    return to_asr_pcm(audio, samplerate)
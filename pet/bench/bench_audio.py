@@ -0,0 +1,74 @@
+"""
+录音 -> ASR输入 的拷贝次数和耗时对比：
+- 原版：int16数组 -> sf.write到SpooledTemporaryFile -> read() -> 切掉[44:]
+- 现在：int16数组 -> pcm_view()，memoryview直接交给ASR
+拷贝次数用tracemalloc的峰值新分配字节数 ÷ 音频字节数估算。
+用法：python bench/bench_audio.py [--seconds 5 10 30] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio_io import pcm_view, parse_wav
+
+
+def legacy_path(audio, samplerate=16000):
+    wav_buffer = tempfile.SpooledTemporaryFile()
+    sf.write(wav_buffer, audio, samplerate, format='WAV')
+    wav_buffer.seek(0)
+    wav_bytes = wav_buffer.read()
+    wav_buffer.close()
+    return wav_bytes[44:] if len(wav_bytes) > 44 else wav_bytes
+
+
+def new_path(audio, samplerate=16000):
+    return pcm_view(audio)
+
+
+def measure(fn, audio, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(audio)
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    tracemalloc.start()
+    fn(audio)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / audio.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, nargs="+", default=[5, 10, 30])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'时长(秒)':>8} {'音频KB':>8} {'原版ms':>8} {'原版拷贝':>8} {'现在ms':>8} {'现在拷贝':>8}")
+    for seconds in args.seconds:
+        audio = (rng.standard_normal(int(seconds * 16000)) * 3000).astype(np.int16)
+        # 两条通路给ASR的PCM内容必须一致
+        assert bytes(legacy_path(audio)) == bytes(new_path(audio))
+        legacy_ms, legacy_copies = measure(legacy_path, audio, args.repeat)
+        new_ms, new_copies = measure(new_path, audio, args.repeat)
+        print(f"{seconds:>8.0f} {audio.nbytes / 1024:>8.0f} {legacy_ms:>8.2f} {legacy_copies:>8.1f} {new_ms:>8.3f} {new_copies:>8.1f}")
+
+    # soundfile写出的WAV带额外块时，固定切44字节会把块头当成音频
+    audio = (rng.standard_normal(16000) * 3000).astype(np.int16)
+    with tempfile.SpooledTemporaryFile() as f:
+        sf.write(f, audio, 16000, format='WAV')
+        f.seek(0)
+        wav_bytes = f.read()
+    header_len = len(wav_bytes) - len(parse_wav(wav_bytes)[3])
+    print(f"\nsoundfile生成的WAV头实际长度：{header_len} 字节（原版假设44字节）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+本地FAQ检索基准：
+- 构建/加载耗时：离线构建一次；加载时mmap，只解析头部
+- 单次检索耗时p50/p95/p99
+- 命中率：faq_queries.jsonl 里标注了应命中的条目（expect为null表示不该直接作答）
+  直接作答率、直接作答的准确率、不该作答却作答的条数、参考资料的召回率
+  不该作答的包括“常见问题+急症描述”这类复合问题，检验覆盖率能否把它们交给大模型；
+  没说年龄的喂食问题也不该直接作答（幼犬和成犬的答案不同）
+  出现答错（直接作答但不是期望的条目）或误作答时以非0状态退出，可放进CI
+用法：python bench/bench_faq.py [--answer-threshold 0.8] [--context-threshold 0.35] [--coverage-threshold 0.65] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from faq_index import FAQIndex, build_index, DEFAULT_FAQ_PATH
+from telemetry import percentile
+
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq_queries.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faq", default=DEFAULT_FAQ_PATH)
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--answer-threshold", type=float, default=0.8)
+    parser.add_argument("--context-threshold", type=float, default=0.35)
+    parser.add_argument("--coverage-threshold", type=float, default=0.65)
+    parser.add_argument("--repeat", type=int, default=200, help="每条查询重复次数，用于测耗时")
+    args = parser.parse_args()
+
+    with open(args.queries, 'r', encoding='utf-8') as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, "faq_index.bin")
+        start = time.perf_counter()
+        count = build_index(args.faq, index_path)
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        index = FAQIndex(index_path)
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"FAQ {count} 条，索引 {os.path.getsize(index_path) / 1024:.1f} KB，构建 {build_ms:.1f} ms，加载(mmap) {load_ms:.2f} ms")
+
+        latencies = []
+        for row in queries:
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                index.lookup(row["query"], args.answer_threshold, args.context_threshold,
+                             coverage_threshold=args.coverage_threshold)
+                latencies.append((time.perf_counter() - t) * 1e6)
+        print(f"单次检索：p50 {percentile(latencies, 50):.0f} µs · p95 {percentile(latencies, 95):.0f} µs · p99 {percentile(latencies, 99):.0f} µs")
+
+        positives = [row for row in queries if row["expect"]]
+        negatives = [row for row in queries if not row["expect"]]
+        answered = correct = wrong_answers = false_answers = recalled = 0
+        misses = []
+        for row in queries:
+            result = index.lookup(row["query"], args.answer_threshold, args.context_threshold,
+                                  coverage_threshold=args.coverage_threshold)
+            hit_id = result["hit"]["id"] if result["hit"] else None
+            if row["expect"]:
+                answered += hit_id is not None
+                correct += hit_id == row["expect"]
+                wrong_answers += hit_id is not None and hit_id != row["expect"]
+                recalled += any(p["id"] == row["expect"] for p in result["passages"])
+                if hit_id != row["expect"]:
+                    misses.append((row["query"], row["expect"], hit_id))
+            elif hit_id is not None:
+                false_answers += 1
+                misses.append((row["query"], None, hit_id))
+        index.close()
+
+    print(f"应命中 {len(positives)} 条：直接作答 {answered} 条（{answered / len(positives):.0%}），"
+          f"其中正确 {correct} 条（准确率 {correct / answered if answered else 0:.0%}）；参考资料召回 {recalled / len(positives):.0%}")
+    print(f"不该作答 {len(negatives)} 条：误作答 {false_answers} 条")
+    print(f"省掉的大模型调用：{correct / len(queries):.0%} 的查询直接用库里的答案")
+    for query, expect, got in misses:
+        print(f"  ✗ {query}  期望 {expect}  实际 {got}")
+    if wrong_answers or false_answers:
+        print(f"答错 {wrong_answers} 条、误作答 {false_answers} 条：库里的答案被错误地直接返回")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+意图识别基准：对比原来的逐列表any()扫描和Aho-Corasick引擎
+- 准确率：intent_corpus.jsonl 里的标注语料
+- 单条耗时：关键词表从几十个扩到上万个时的变化
+- 配置检查：同一关键词出现在两个意图里时加载应报错（检查不通过以非0状态退出）
+用法：python bench/bench_intent.py [--sizes 0 100 1000 10000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from intent_engine import IntentEngine, DEFAULT_CONFIG_PATH
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_corpus.jsonl")
+
+
+def legacy_detect_intent(user_input, history_keywords, current_image_keywords):
+    """原版detect_intent：先查历史关键词列表，再查当前图片关键词列表"""
+    if any(keyword in user_input for keyword in history_keywords):
+        return "history"
+    elif any(keyword in user_input for keyword in current_image_keywords):
+        return "current_image"
+    else:
+        return "default"
+
+
+def load_corpus():
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def random_keywords(n, seed=0):
+    """生成n个互不相同、不会出现在语料里的随机汉字关键词，模拟关键词表变大"""
+    rng = random.Random(seed)
+    keywords = {}
+    while len(keywords) < n:
+        keywords.setdefault("".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(2, 4))))
+    return list(keywords)
+
+
+def check_duplicate_keywords(config):
+    """同一关键词分属两个意图、或既是关键词又是忽略词时，IntentEngine应拒绝加载；返回失败项列表"""
+    failures = []
+    intents = list(config["intents"])
+    keyword = config["intents"][intents[0]]["keywords"][0]
+    cases = {"两个意图": {"intents": {intents[0]: {"keywords": [keyword]}, intents[1]: {"keywords": [keyword]}}},
+             "意图与忽略词": {"intents": {intents[0]: {"keywords": [keyword]}}, "ignore": [keyword]}}
+    for label, case in cases.items():
+        try:
+            IntentEngine(case)
+        except ValueError:
+            continue
+        failures.append(f"{label}重复的关键词“{keyword}”没有报错")
+    try:
+        IntentEngine({"intents": {intents[0]: {"keywords": [keyword, keyword]}}})
+    except ValueError:
+        failures.append("同一意图里重复的关键词不应报错")
+    return failures
+
+
+def time_per_message(fn, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (repeat * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 100, 1000, 10000], help="额外加入的关键词数")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(DEFAULT_CONFIG_PATH, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    corpus = load_corpus()
+    texts = [row["text"] for row in corpus]
+
+    # 原版关键词表（与改造前的detect_intent一致）
+    legacy_history = ["之前", "刚才", "之前问的", "那只", "之前的", "之前说的",
+                      "之前的问题", "上一个问题", "上一个", "刚才问的"]
+    legacy_current = ["这只", "这是什么", "它", "这张", "当前", "现在"]
+
+    failures = check_duplicate_keywords(config)
+    print("配置检查：" + ("通过" if not failures else "；".join(failures)))
+    engine = IntentEngine(config)
+    legacy_correct = sum(legacy_detect_intent(r["text"], legacy_history, legacy_current) == r["intent"] for r in corpus)
+    engine_correct = sum(engine.detect(r["text"]) == r["intent"] for r in corpus)
+    print(f"语料 {len(corpus)} 条")
+    print(f"准确率：原版 {legacy_correct / len(corpus):.1%}    自动机引擎 {engine_correct / len(corpus):.1%}")
+    for row in corpus:
+        intent, confidence, hits = engine.classify(row["text"])
+        if intent != row["intent"]:
+            print(f"  误判：{row['text']}  期望 {row['intent']}  得到 {intent}（{confidence:.2f}，{hits}）")
+
+    print(f"\n{'额外关键词':>10} {'原版 μs/条':>12} {'引擎 μs/条':>12} {'构建 ms':>10}")
+    for size in args.sizes:
+        extra = random_keywords(size)
+        history = legacy_history + extra[: size // 2]
+        current = legacy_current + extra[size // 2:]
+        grown = json.loads(json.dumps(config))
+        grown["intents"]["history"]["keywords"] += extra[: size // 2]
+        grown["intents"]["current_image"]["keywords"] += extra[size // 2:]
+
+        build_start = time.perf_counter()
+        grown_engine = IntentEngine(grown)
+        build_ms = (time.perf_counter() - build_start) * 1000
+
+        legacy_us = time_per_message(lambda t: legacy_detect_intent(t, history, current), texts, args.repeat)
+        engine_us = time_per_message(grown_engine.detect, texts, args.repeat)
+        print(f"{size:>10} {legacy_us:>12.1f} {engine_us:>12.1f} {build_ms:>10.1f}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
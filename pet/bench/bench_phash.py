@@ -0,0 +1,141 @@
+"""
+感知哈希索引基准（test_picture里的照片 + 合成变体）：
+- 变体：缩小、重新压缩成低质量JPEG、截图（加边框再缩放）、轻微裁剪、调亮度、转灰度
+- 召回：每张原图入库后，它的变体能否命中原图
+- 误判：不同照片（含合成的纯色/噪声图）之间是否被当成同一张
+- 距离分布：同图变体和不同照片的pHash/dHash汉明距离，用来确定阈值
+- 耗时：单张哈希计算、批量哈希、在1万/10万条记录里查找一次
+用法：python bench/bench_phash.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from phash_index import PerceptualIndex, perceptual_hashes, image_hashes, hamming
+
+PICTURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_picture")
+
+
+def reencode(image, fmt="JPEG", **kwargs):
+    out = io.BytesIO()
+    image.convert("RGB").save(out, format=fmt, **kwargs)
+    return Image.open(io.BytesIO(out.getvalue()))
+
+
+def variants(image):
+    w, h = image.size
+    rgb = image.convert("RGB")
+    return {
+        "缩小50%": rgb.resize((w // 2, h // 2)),
+        "缩小25%": rgb.resize((max(1, w // 4), max(1, h // 4))),
+        "JPEG质量30": reencode(rgb, quality=30),
+        "截图加边框": ImageOps.expand(rgb, border=max(4, w // 40), fill=(245, 245, 245)).resize((int(w * 0.8), int(h * 0.8))),
+        "裁掉3%": rgb.crop((int(w * 0.03), int(h * 0.03), int(w * 0.97), int(h * 0.97))),
+        "调亮20%": ImageEnhance.Brightness(rgb).enhance(1.2),
+        "灰度": rgb.convert("L"),
+    }
+
+
+def synthetic_distractors(rng, n=20, size=256):
+    """和测试照片毫不相关的合成图：随机色块、渐变、噪声"""
+    images = []
+    for idx in range(n):
+        kind = idx % 3
+        if kind == 0:
+            arr = np.kron(rng.integers(0, 255, (8, 8, 3)), np.ones((size // 8, size // 8, 1))).astype(np.uint8)
+        elif kind == 1:
+            angle = rng.uniform(0, np.pi)
+            yy, xx = np.mgrid[0:size, 0:size]
+            grad = (np.cos(angle) * xx + np.sin(angle) * yy)
+            grad = (255 * (grad - grad.min()) / np.ptp(grad)).astype(np.uint8)
+            arr = np.stack([grad, np.roll(grad, size // 3, axis=1), 255 - grad], axis=2)
+        else:
+            arr = rng.integers(0, 255, (size, size, 3)).astype(np.uint8)
+        images.append(Image.fromarray(arr))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    names = sorted(n for n in os.listdir(PICTURE_DIR) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+    originals = [Image.open(os.path.join(PICTURE_DIR, n)) for n in names]
+    for image in originals:
+        image.load()
+
+    index = PerceptualIndex(path=None)
+    orig_p, orig_d = perceptual_hashes(originals)
+    for name, p, d in zip(names, orig_p, orig_d):
+        index.add(name, int(p), int(d), {"breed": name}, persist=False)
+
+    # 召回：变体应命中自己的原图
+    same_p, same_d = [], []
+    hits = total = 0
+    print("变体召回：")
+    for name, image in zip(names, originals):
+        row = []
+        for label, variant in variants(image).items():
+            p, d = perceptual_hashes([variant])
+            match = index.find(int(p[0]), int(d[0]))
+            ok = match is not None and match["image_hash"] == name
+            hits += ok
+            total += 1
+            own = names.index(name)
+            same_p.append(int(hamming(orig_p[own:own + 1], int(p[0]))[0]))
+            same_d.append(int(hamming(orig_d[own:own + 1], int(d[0]))[0]))
+            row.append(f"{label}{'✓' if ok else '✗'}({same_p[-1]}/{same_d[-1]})")
+        print(f"  {name}：" + " ".join(row))
+    print(f"  召回率 {hits}/{total} = {hits / total:.0%}（括号内为 pHash/dHash 距离）")
+
+    # 误判：不同照片之间、合成图与照片之间
+    diff_p, diff_d = [], []
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            diff_p.append(int(hamming(orig_p[i:i + 1], int(orig_p[j]))[0]))
+            diff_d.append(int(hamming(orig_d[i:i + 1], int(orig_d[j]))[0]))
+    distractors = synthetic_distractors(rng)
+    dist_p, dist_d = perceptual_hashes(distractors)
+    false_hits = sum(index.find(int(p), int(d)) is not None for p, d in zip(dist_p, dist_d))
+    for p, d in zip(dist_p, dist_d):
+        diff_p.extend(int(x) for x in hamming(orig_p, int(p)))
+        diff_d.extend(int(x) for x in hamming(orig_d, int(d)))
+    print(f"\n误判：{len(distractors)} 张合成图中 {false_hits} 张被当成已有照片")
+    print(f"距离分布  同图变体 pHash 最大 {max(same_p)} · dHash 最大 {max(same_d)}")
+    print(f"          不同图片 pHash 最小 {min(diff_p)} · dHash 最小 {min(diff_d)}")
+    print(f"          当前阈值 pHash ≤ {index.phash_distance} 且 dHash ≤ {index.dhash_distance}")
+
+    # 耗时
+    with open(os.path.join(PICTURE_DIR, names[0]), 'rb') as f:
+        data = f.read()
+    start = time.perf_counter()
+    for _ in range(20):
+        image_hashes(data)
+    single_ms = (time.perf_counter() - start) / 20 * 1000
+    batch = [v for image in originals for v in variants(image).values()]
+    start = time.perf_counter()
+    perceptual_hashes(batch)
+    batch_ms = (time.perf_counter() - start) / len(batch) * 1000
+    print(f"\n哈希计算：单张（含解码）{single_ms:.1f} ms · 批量每张 {batch_ms:.1f} ms（{len(batch)} 张）")
+    for size in args.sizes:
+        big = PerceptualIndex(path=None, max_entries=size)
+        big._phash = rng.integers(0, 2 ** 63, size, dtype=np.uint64)
+        big._dhash = rng.integers(0, 2 ** 63, size, dtype=np.uint64)
+        big._records = [{"image_hash": str(i), "analysis": None} for i in range(size)]
+        start = time.perf_counter()
+        for p, d in zip(orig_p, orig_d):
+            big.find(int(p), int(d))
+        lookup_ms = (time.perf_counter() - start) / len(orig_p) * 1000
+        print(f"查找：{size:>7} 条记录 {lookup_ms:.2f} ms/次")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+pet_assistant.py 启动开销对比：每个模块在全新子进程里的导入耗时。
+- 原版在脚本顶部导入sounddevice/numpy/aip/soundfile，每个进程第一次执行都要付
+- 现在这几个在第一次用到语音功能时才导入，纯文字会话完全不付
+“streamlit之后”一列是先导入streamlit再导入该模块的增量：streamlit自己就依赖numpy，
+所以numpy那一行在实际运行中省不了多少，真正省下的是sounddevice（加载PortAudio并探测设备）和aip。
+用法：python bench/bench_startup.py [--repeat 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+PET_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 原版顶部导入、现在改为按需导入的模块
+LAZY_MODULES = ["sounddevice", "numpy", "aip", "soundfile", "audio_io", "vad"]
+# 两版都在顶部导入的本地模块（作为对照）
+EAGER_MODULES = ["llm_client", "telemetry", "chat_store", "scheduler", "image_analysis", "model_router"]
+
+_SNIPPET = """
+import sys, time
+sys.path.insert(0, {pet_dir!r})
+for name in {preload!r}:
+    __import__(name)
+start = time.perf_counter()
+__import__({name!r})
+print(time.perf_counter() - start)
+"""
+
+
+def import_seconds(name, preload=(), repeat=5):
+    """在全新子进程里导入name的耗时（取多次的最小值）；导入失败返回None"""
+    best = None
+    for _ in range(repeat):
+        code = _SNIPPET.format(pet_dir=PET_DIR, preload=list(preload), name=name)
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        seconds = float(result.stdout.strip().splitlines()[-1])
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def fmt(seconds):
+    return f"{seconds * 1000:>10.1f}" if seconds is not None else f"{'未安装':>8}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    has_streamlit = import_seconds("streamlit", repeat=1) is not None
+    print(f"{'模块':<16}{'单独导入ms':>12}{'streamlit之后ms':>16}")
+    saved = saved_after_streamlit = 0.0
+    for label, modules in (("按需导入", LAZY_MODULES), ("顶部导入", EAGER_MODULES)):
+        print(f"-- {label}")
+        for name in modules:
+            alone = import_seconds(name, repeat=args.repeat)
+            after = import_seconds(name, preload=["streamlit"], repeat=args.repeat) if has_streamlit else None
+            print(f"{name:<16}{fmt(alone):>12}{fmt(after) if has_streamlit else '-':>16}")
+            if label == "按需导入":
+                saved += alone or 0.0
+                saved_after_streamlit += after or 0.0
+
+    print(f"\n纯文字会话每个进程省下的导入时间：约 {saved * 1000:.0f} ms（各模块单独计，有重叠依赖时偏大）")
+    if has_streamlit:
+        print(f"在streamlit已加载的前提下：约 {saved_after_streamlit * 1000:.0f} ms")
+    else:
+        print("没装streamlit，跳过“streamlit之后”一列")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+整轮对话压测：全部走本地替身（bench/fakes.py），不联网、不需要API Key，可在CI里跑。
+两种模式：
+- pipeline：直接调用历史窗口 + 统一大模型客户端（流式）+ 语音合成流水线，多会话并发
+- streamlit：用 Streamlit 的测试接口 AppTest 驱动 pet_assistant.py，每个AppTest是一个独立会话
+输出吞吐量、整轮延迟和首字延迟的p50/p95/p99；--max-p95 超标时退出码为1，便于发现性能回退。
+用法：
+  python bench/bench_turns.py --mode pipeline --sessions 8 --turns 5 --latency 0.2 --error-rate 0.05
+  python bench/bench_turns.py --mode streamlit --sessions 4 --turns 3 --json bench_result.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+
+PET_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PET_DIR)
+from fakes import Behavior, FakeAipSpeech, FakeZhipuClient
+from history_manager import HistoryWindow
+from llm_client import LLMClient, set_llm_client
+from telemetry import percentile
+from tts_cache import TTSCache
+from tts_pipeline import split_text_for_tts, synthesize_segments
+
+QUESTIONS = [
+    "这是什么品种？",
+    "它一直挠耳朵怎么办？",
+    "多久喂一次比较合适？",
+    "需要打哪些疫苗？",
+    "之前的问题是什么？",
+    "它掉毛很严重正常吗？",
+]
+SYSTEM_PROMPT = "你是专业的宠物养护助手，回答要简洁实用。"
+
+
+def session_questions(session_idx, turns, repeat_questions):
+    """每个会话的提问序列；默认给问题加上会话标记，避免进程级问答缓存让后面的会话全部命中"""
+    questions = [QUESTIONS[(session_idx + i) % len(QUESTIONS)] for i in range(turns)]
+    if repeat_questions:
+        return questions
+    return [f"{q}（会话{session_idx}第{i}轮）" for i, q in enumerate(questions)]
+
+
+def summarize(latencies, ttfts, errors, wall_seconds):
+    def pct(values):
+        return {f"p{q}": round(percentile(values, q), 4) if values else None for q in (50, 95, 99)}
+
+    return {
+        "turns": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_turns_per_sec": round(len(latencies) / wall_seconds, 3) if wall_seconds else None,
+        "latency": dict(pct(latencies), mean=round(sum(latencies) / len(latencies), 4) if latencies else None),
+        "ttft": pct(ttfts),
+    }
+
+
+# ------------------------------
+# pipeline模式：不经过Streamlit，直接驱动各模块
+# ------------------------------
+def run_pipeline_session(session_idx, args, llm, speech, tts_cache):
+    window = HistoryWindow(token_budget=1500)
+    history = []
+    latencies, ttfts, errors = [], [], 0
+    tts_options = {'vol': 5, 'per': 0, 'spd': 5, 'pit': 5, 'aue': 3}
+    for question in session_questions(session_idx, args.turns, args.repeat_questions):
+        start = time.perf_counter()
+        history.append({"role": "user", "content": question})
+        try:
+            stream = llm.create(model="glm-4", messages=window.to_messages(SYSTEM_PROMPT, history), stream=True)
+            parts = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        ttfts.append(time.perf_counter() - start)
+                    parts.append(delta)
+            reply = "".join(parts)
+            history.append({"role": "assistant", "content": reply})
+            synthesize_segments(
+                split_text_for_tts(reply),
+                lambda seg: tts_cache.get_or_synthesize(seg, tts_options, lambda s, o: speech.synthesis(s, 'zh', 1, o)),
+                args.tts_workers,
+            )
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return latencies, ttfts, errors
+
+
+def run_pipeline(args, llm_behavior, speech_behavior):
+    llm = LLMClient(sdk_client=FakeZhipuClient(llm_behavior), max_concurrency=args.llm_concurrency,
+                    max_retries=args.max_retries, timeout=args.timeout)
+    speech = FakeAipSpeech(behavior=speech_behavior)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        tts_cache = TTSCache(cache_dir=cache_dir)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            results = list(pool.map(lambda i: run_pipeline_session(i, args, llm, speech, tts_cache), range(args.sessions)))
+        wall = time.perf_counter() - start
+    latencies = [x for r in results for x in r[0]]
+    ttfts = [x for r in results for x in r[1]]
+    report = summarize(latencies, ttfts, sum(r[2] for r in results), wall)
+    report["llm_client"] = dict(llm.stats)
+    return report
+
+
+# ------------------------------
+# streamlit模式：AppTest驱动真实页面脚本
+# ------------------------------
+def install_streamlit_fakes(llm_behavior, speech_behavior, args):
+    """让pet_assistant.py在同一进程里拿到本地替身：共享大模型客户端 + 假的aip模块"""
+    os.environ.setdefault("ZHIPU_API_KEY", "fake-key")
+    for name in ("BAIDU_APP_ID", "BAIDU_API_KEY", "BAIDU_SECRET_KEY"):
+        os.environ.setdefault(name, "fake")
+    # 压测不写埋点文件，语音缓存和对话库放临时目录
+    os.environ["TELEMETRY_JSONL"] = ""
+    os.environ.setdefault("TTS_CACHE_DIR", tempfile.mkdtemp(prefix="pet_bench_tts_"))
+    os.environ.setdefault("CHAT_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="pet_bench_chat_"), "chat.db"))
+    set_llm_client(LLMClient(sdk_client=FakeZhipuClient(llm_behavior), max_concurrency=args.llm_concurrency,
+                             max_retries=args.max_retries, timeout=args.timeout))
+    fake_aip = ModuleType("aip")
+    fake_aip.AipSpeech = lambda app_id, api_key, secret_key: FakeAipSpeech(app_id, api_key, secret_key, behavior=speech_behavior)
+    sys.modules["aip"] = fake_aip
+
+
+def run_streamlit_session(session_idx, args):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(PET_DIR, "pet_assistant.py"), default_timeout=args.timeout * 2)
+    app.session_state["use_stream"] = True
+    app.run()
+    latencies, errors = [], 0
+    for question in session_questions(session_idx, args.turns, args.repeat_questions):
+        start = time.perf_counter()
+        app.chat_input[0].set_value(question).run()
+        if app.exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+def run_streamlit(args, llm_behavior, speech_behavior):
+    install_streamlit_fakes(llm_behavior, speech_behavior, args)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        results = list(pool.map(lambda i: run_streamlit_session(i, args), range(args.sessions)))
+    wall = time.perf_counter() - start
+    # AppTest拿不到流式首字时间，只统计整轮耗时
+    return summarize([x for r in results for x in r[0]], [], sum(r[1] for r in results), wall)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["pipeline", "streamlit"], default="pipeline")
+    parser.add_argument("--sessions", type=int, default=4, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的轮数")
+    parser.add_argument("--latency", type=float, default=0.2, help="大模型首包延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--per-token", type=float, default=0.005, help="流式增量间隔（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="大模型返回429的概率")
+    parser.add_argument("--tts-latency", type=float, default=0.1)
+    parser.add_argument("--tts-error-rate", type=float, default=0.0)
+    parser.add_argument("--tts-workers", type=int, default=4)
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--repeat-questions", action="store_true", help="各会话问同样的问题（会命中问答缓存）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果写到JSON文件")
+    parser.add_argument("--max-p95", type=float, help="整轮p95超过该秒数时以退出码1结束")
+    args = parser.parse_args()
+
+    llm_behavior = Behavior(args.latency, args.jitter, args.per_token, args.error_rate, seed=args.seed)
+    speech_behavior = Behavior(args.tts_latency, args.jitter, 0, args.tts_error_rate, seed=args.seed + 1)
+    if args.mode == "pipeline":
+        report = run_pipeline(args, llm_behavior, speech_behavior)
+    else:
+        report = run_streamlit(args, llm_behavior, speech_behavior)
+    report.update(mode=args.mode, sessions=args.sessions, upstream_llm=dict(llm_behavior.stats),
+                  upstream_speech=dict(speech_behavior.stats))
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    p95 = report["latency"]["p95"]
+    if args.max_p95 is not None and (p95 is None or p95 > args.max_p95):
+        print(f"整轮p95 {p95} 秒超过阈值 {args.max_p95} 秒", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
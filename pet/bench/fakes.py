@@ -0,0 +1,205 @@
+"""
+本地替身：不联网、不需要API Key就能压测各个入口。
+- FakeZhipuClient：实现 chat.completions.create（含 stream=True），可直接作为 LLMClient 的 sdk_client
+- FakeAipSpeech：实现百度 AipSpeech 的 asr / synthesis
+- FakeChatServer：本地HTTP服务，兼容 /chat/completions（JSON和SSE流式），配合 ZHIPU_BASE_URL 测真实SDK
+延迟、抖动、错误率都可配置，同一个 Behavior 可在多个替身间共用。
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+DEFAULT_REPLY = "这是一只边境牧羊犬，毛色黑白相间。建议每天喂两次，定期驱虫，注意清洁耳道。如果持续挠耳朵，可能是耳螨或过敏，请及时就医。"
+# 最小的MP3帧头（MPEG1 Layer3 128kbps 44.1kHz），后面补零，足够让拼接和播放器逻辑跑通
+FAKE_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+class FakeAPIError(Exception):
+    """模拟的上游错误，带status_code，llm_client.is_retryable 会按状态码判断是否重试"""
+
+    def __init__(self, status_code=429, message="fake upstream error"):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class Behavior:
+    """
+    注入的延迟和故障：
+    latency 首包前的固定延迟（秒），jitter 在其上叠加的均匀随机抖动，
+    per_token 流式时每个增量之间的间隔，error_rate 按概率抛 error_status 错误。
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, per_token=0.005, error_rate=0.0, error_status=429, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_token = per_token
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0}
+
+    def wait(self):
+        """模拟首包延迟，按错误率决定是否失败"""
+        with self._lock:
+            self.stats["calls"] += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.stats["errors"] += 1
+        time.sleep(delay)
+        if fail:
+            raise FakeAPIError(self.error_status)
+
+    def token_gap(self):
+        if self.per_token > 0:
+            time.sleep(self.per_token)
+
+
+def split_reply(text, size=4):
+    """把回复切成若干增量，模拟流式token"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _chunk(delta):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta), index=0)])
+
+
+def _completion(text, model):
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=text), index=0, finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=0, completion_tokens=len(text), total_tokens=len(text)),
+    )
+
+
+class FakeZhipuClient:
+    """和智谱SDK一样的 client.chat.completions.create(...) 用法；reply_fn(model, messages) 可自定义回复"""
+
+    def __init__(self, behavior=None, reply_fn=None):
+        self.behavior = behavior or Behavior()
+        self.reply_fn = reply_fn or (lambda model, messages: DEFAULT_REPLY)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        self.requests.append({"model": model, "messages": messages, "stream": stream})
+        self.behavior.wait()
+        text = self.reply_fn(model, messages)
+        if stream:
+            return self._stream(text)
+        return _completion(text, model)
+
+    def _stream(self, text):
+        for piece in split_reply(text):
+            self.behavior.token_gap()
+            yield _chunk(piece)
+
+
+class FakeAipSpeech:
+    """百度 AipSpeech 的替身：asr 返回固定识别结果，synthesis 按文本长度返回假MP3"""
+
+    def __init__(self, app_id=None, api_key=None, secret_key=None, behavior=None, transcript="它一直挠耳朵怎么办"):
+        self.behavior = behavior or Behavior(latency=0.1, jitter=0.05, per_token=0)
+        self.transcript = transcript
+
+    def asr(self, speech, format='pcm', rate=16000, options=None):
+        try:
+            self.behavior.wait()
+        except FakeAPIError as e:
+            return {"err_no": 3302, "err_msg": f"fake error {e.status_code}"}
+        if not speech:
+            return {"err_no": 3301, "err_msg": "speech quality error."}
+        return {"err_no": 0, "err_msg": "success.", "result": [self.transcript]}
+
+    def synthesis(self, text, lang='zh', ctp=1, options=None):
+        try:
+            self.behavior.wait()
+        except FakeAPIError as e:
+            return {"err_no": 502, "err_msg": f"fake error {e.status_code}"}
+        # 大约每10个字一帧，音频大小随文本长度增长
+        return FAKE_MP3_FRAME * max(1, len(text) // 10)
+
+
+class FakeChatServer:
+    """
+    本地HTTP服务，路径以 /chat/completions 结尾即可，兼容智谱/OpenAI的请求体。
+    用法：server = FakeChatServer(behavior).start()；然后 ZHIPU_BASE_URL=server.base_url
+    """
+
+    def __init__(self, behavior=None, reply_fn=None, host="127.0.0.1", port=0):
+        self.behavior = behavior or Behavior()
+        self.reply_fn = reply_fn or (lambda model, messages: DEFAULT_REPLY)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/paas/v4"
+
+    def _handler(self):
+        server = self
+
+        class ChatHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                try:
+                    server.behavior.wait()
+                except FakeAPIError as e:
+                    self._send_json(e.status_code, {"error": {"code": str(e.status_code), "message": "fake upstream error"}})
+                    return
+                model = body.get("model")
+                text = server.reply_fn(model, body.get("messages"))
+                if body.get("stream"):
+                    self._send_stream(model, text)
+                else:
+                    self._send_json(200, {
+                        "id": "fake", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": len(text), "total_tokens": len(text)},
+                    })
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, model, text):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for piece in split_reply(text):
+                    server.behavior.token_gap()
+                    event = {"id": "fake", "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}}]}
+                    self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        return ChatHandler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,193 @@
+"""
+会话大对象管理（图片等）：
+- 只保存一份原始字节，需要data URL时才临时做base64编码（base64比原始字节大1/3）
+- 相同内容的对象在进程内只存一份，按引用它的会话计数
+- 整个进程的驻留内存有上限，超出时把最久未用的对象写到临时目录，用到时再读回
+- 会话结束（session_state被回收）时释放该会话的引用，没人引用的对象连同磁盘文件一起删除
+会话按SessionBlobs句柄区分而不是URL里的sid：刷新页面时旧会话的回收不会误删新会话刚存的图。
+"""
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+
+
+class BlobNotFound(LookupError):
+    """对象已被释放（比如换图后旧图的最后一个引用已删除）"""
+
+
+class _Blob:
+    __slots__ = ("data", "size", "mime", "path", "owners")
+
+    def __init__(self, data, mime):
+        self.data = data
+        self.size = len(data)
+        self.mime = mime
+        self.path = None  # 落盘后的文件路径
+        self.owners = set()
+
+
+class SessionBlobs:
+    """单个会话对BlobManager的视图"""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.owner = uuid.uuid4().hex
+        weakref.finalize(self, manager.release_owner, self.owner)
+
+    def put(self, data, mime="application/octet-stream"):
+        return self.manager.put(self.owner, data, mime)
+
+    def get(self, blob_id):
+        return self.manager.get(blob_id)
+
+    def data_url(self, blob_id):
+        """对象已释放时抛BlobNotFound"""
+        return self.manager.data_url(blob_id)
+
+    def release(self, blob_id):
+        self.manager.release(self.owner, blob_id)
+
+    def memory(self):
+        """（驻留内存字节, 已落盘字节）"""
+        return self.manager.owner_bytes(self.owner)
+
+
+class BlobManager:
+    """进程级共享，线程安全"""
+
+    def __init__(self, memory_budget=256 * 1024 * 1024, spill_dir=None):
+        """spill_dir为落盘的父目录（默认系统临时目录），每个管理器在其下建一个自己的子目录，回收或进程退出时删除"""
+        self.memory_budget = memory_budget
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = tempfile.mkdtemp(prefix="pet_blobs_", dir=spill_dir or None)
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+        self._lock = threading.Lock()
+        self._blobs = OrderedDict()  # blob_id -> _Blob，按最近使用排序
+        self._resident_bytes = 0
+        self.stats = {"spills": 0, "reloads": 0}
+
+    def put(self, owner, data, mime="application/octet-stream"):
+        """存入字节并登记owner的引用，返回blob_id；相同内容只存一份"""
+        blob_id = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            blob = self._blobs.get(blob_id)
+            if blob is None:
+                blob = _Blob(bytes(data), mime)
+                self._blobs[blob_id] = blob
+                self._resident_bytes += blob.size
+            blob.owners.add(owner)
+            self._blobs.move_to_end(blob_id)
+            self._enforce_budget(keep=blob_id)
+        return blob_id
+
+    def _touch(self, blob_id):
+        """持锁调用：标记最近使用，已落盘的读回内存；不存在时返回None"""
+        blob = self._blobs.get(blob_id)
+        if blob is None:
+            return None
+        self._blobs.move_to_end(blob_id)
+        if blob.data is None:
+            with open(blob.path, 'rb') as f:
+                blob.data = f.read()
+            self._resident_bytes += blob.size
+            self.stats["reloads"] += 1
+            self._enforce_budget(keep=blob_id)
+        return blob
+
+    def get(self, blob_id):
+        """取原始字节，已落盘的读回内存；不存在时返回None"""
+        with self._lock:
+            blob = self._touch(blob_id)
+            return blob.data if blob is not None else None
+
+    def data_url(self, blob_id):
+        """按需编码成data URL，编码结果不常驻；对象已释放时抛BlobNotFound"""
+        with self._lock:
+            blob = self._touch(blob_id)
+            if blob is None:
+                raise BlobNotFound(f"图片已释放：{blob_id}")
+            data, mime = blob.data, blob.mime
+        return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    def release(self, owner, blob_id):
+        """owner不再使用该对象；没有任何引用时删除"""
+        with self._lock:
+            blob = self._blobs.get(blob_id)
+            if blob is None:
+                return
+            blob.owners.discard(owner)
+            if not blob.owners:
+                self._drop(blob_id)
+
+    def release_owner(self, owner):
+        """会话结束：释放它引用的全部对象"""
+        with self._lock:
+            for blob_id in [bid for bid, blob in self._blobs.items() if owner in blob.owners]:
+                blob = self._blobs[blob_id]
+                blob.owners.discard(owner)
+                if not blob.owners:
+                    self._drop(blob_id)
+
+    def open_session(self):
+        """新建一个会话句柄，放进session_state；会话结束句柄被回收时自动释放它的全部引用"""
+        return SessionBlobs(self)
+
+    def _drop(self, blob_id):
+        blob = self._blobs.pop(blob_id)
+        if blob.data is not None:
+            self._resident_bytes -= blob.size
+        if blob.path:
+            try:
+                os.remove(blob.path)
+            except OSError:
+                pass
+
+    def _enforce_budget(self, keep=None):
+        """超出内存上限时按LRU把对象写到磁盘（刚用到的那个除外）"""
+        for blob_id, blob in list(self._blobs.items()):
+            if self._resident_bytes <= self.memory_budget:
+                break
+            if blob_id == keep or blob.data is None:
+                continue
+            if blob.path is None:
+                path = os.path.join(self.spill_dir, blob_id)
+                try:
+                    with open(path, 'wb') as f:
+                        f.write(blob.data)
+                except OSError:
+                    continue
+                blob.path = path
+            blob.data = None
+            self._resident_bytes -= blob.size
+            self.stats["spills"] += 1
+
+    def owner_bytes(self, owner):
+        """返回（该会话引用的驻留内存字节, 已落盘字节）"""
+        with self._lock:
+            resident = spilled = 0
+            for blob in self._blobs.values():
+                if owner in blob.owners:
+                    if blob.data is not None:
+                        resident += blob.size
+                    else:
+                        spilled += blob.size
+        return resident, spilled
+
+    def summary(self):
+        with self._lock:
+            spilled = sum(1 for blob in self._blobs.values() if blob.data is None)
+            return dict(self.stats, blobs=len(self._blobs), spilled_blobs=spilled,
+                        resident_bytes=self._resident_bytes, memory_budget=self.memory_budget)
+
+    def close(self):
+        with self._lock:
+            self._blobs.clear()
+            self._resident_bytes = 0
+        self._cleanup()
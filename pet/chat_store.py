@@ -0,0 +1,202 @@
+"""
+对话历史持久化：SQLite只追加写入，按（会话, 序号）建索引。
+- 页面只按页读取最近的消息，“加载更早”时再往前翻
+- StoredHistory 是只读的懒加载序列，切片时才查库，历史窗口只会读到未折叠的那一段
+- 每条消息的合并音频、历史窗口的滚动摘要也存在同一个库里，刷新页面不丢
+- 音频按（会话, audio_id）存：不同会话的回复内容相同时audio_id也相同，各存一份，清空一个会话不影响别的会话
+"""
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_history.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    audio_id TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS audio (
+    session_id TEXT NOT NULL,
+    audio_id TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (session_id, audio_id)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    folded_count INTEGER NOT NULL
+);
+"""
+
+
+def _row_to_message(row):
+    seq, role, content, audio_id = row
+    msg = {"role": role, "content": content, "seq": seq}
+    if audio_id:
+        msg["audio_id"] = audio_id
+    return msg
+
+
+class ChatStore:
+    """进程级共享的对话库，所有会话共用一个连接，读写加锁"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate_audio()
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def _migrate_audio(self):
+        """旧库的audio表以audio_id为主键（整库共用一行）：改成按会话存，每个引用它的会话各得一份"""
+        row = self._conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'audio'").fetchone()
+        if not row or "PRIMARY KEY (session_id, audio_id)" in row[0]:
+            return
+        self._conn.execute("ALTER TABLE audio RENAME TO audio_old")
+        self._conn.execute("DROP INDEX IF EXISTS idx_audio_session")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("INSERT OR IGNORE INTO audio (session_id, audio_id, data) SELECT session_id, audio_id, data FROM audio_old")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO audio (session_id, audio_id, data) "
+            "SELECT DISTINCT m.session_id, m.audio_id, a.data FROM messages m JOIN audio_old a ON m.audio_id = a.audio_id"
+        )
+        self._conn.execute("DROP TABLE audio_old")
+        self._conn.commit()
+
+    # ---------- 消息 ----------
+    def append(self, session_id, role, content, audio_id=None):
+        """追加一条消息，返回它在会话里的序号（从0开始）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            seq = row[0]
+            self._conn.execute(
+                "INSERT INTO messages (session_id, seq, role, content, audio_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, seq, role, content, audio_id, time.time()),
+            )
+            self._conn.commit()
+        return seq
+
+    def count(self, session_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def range(self, session_id, start=0, stop=None):
+        """按序号区间 [start, stop) 读取消息，升序"""
+        with self._lock:
+            if stop is None:
+                rows = self._conn.execute(
+                    "SELECT seq, role, content, audio_id FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                    (session_id, start),
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT seq, role, content, audio_id FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                    (session_id, start, stop),
+                ).fetchall()
+        return [_row_to_message(row) for row in rows]
+
+    def recent(self, session_id, limit):
+        """最近limit条消息，升序返回，用于页面分页显示"""
+        total = self.count(session_id)
+        return self.range(session_id, max(0, total - limit), total)
+
+    def history(self, session_id):
+        return StoredHistory(self, session_id)
+
+    def clear(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM audio WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    # ---------- 音频 ----------
+    def put_audio(self, session_id, audio_id, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO audio (session_id, audio_id, data) VALUES (?, ?, ?)",
+                (session_id, audio_id, sqlite3.Binary(data)),
+            )
+            self._conn.commit()
+
+    def get_audio(self, session_id, audio_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM audio WHERE session_id = ? AND audio_id = ?", (session_id, audio_id)
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    # ---------- 滚动摘要 ----------
+    def load_summary(self, session_id):
+        """返回（摘要, 已折叠消息数），没有记录时为（"", 0）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, folded_count FROM summaries WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+
+    def save_summary(self, session_id, summary, folded_count):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (session_id, summary, folded_count) VALUES (?, ?, ?)",
+                (session_id, summary, folded_count),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StoredHistory:
+    """
+    某会话历史的只读视图，用法和列表一样（len / 下标 / 切片 / 迭代），
+    但只在真正取数据时按区间查库；切片返回的仍是视图，不会把全部历史读进内存。
+    """
+
+    def __init__(self, store, session_id, start=0, stop=None):
+        self.store = store
+        self.session_id = session_id
+        self.start = start
+        self.stop = stop
+
+    def _bounds(self):
+        total = self.store.count(self.session_id)
+        stop = total if self.stop is None else min(self.stop, total)
+        return min(self.start, stop), stop
+
+    def __len__(self):
+        start, stop = self._bounds()
+        return stop - start
+
+    def __getitem__(self, index):
+        start, stop = self._bounds()
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError("StoredHistory不支持步长切片")
+            new_start, new_stop, _ = index.indices(stop - start)
+            return StoredHistory(self.store, self.session_id, start + new_start, start + max(new_start, new_stop))
+        if index < 0:
+            index += stop - start
+        if not 0 <= index < stop - start:
+            raise IndexError("StoredHistory index out of range")
+        return self.store.range(self.session_id, start + index, start + index + 1)[0]
+
+    def __iter__(self):
+        start, stop = self._bounds()
+        return iter(self.store.range(self.session_id, start, stop))
@@ -0,0 +1,86 @@
+"""
+命令行对话脚本（Ltest_1.py / Ltest_2_history.py）共用：
+- stream_reply：真正的流式输出，token到一个打印一个
+- replay_dialogues：从JSONL读入多段脚本化对话，各自维护历史并发回放，逐条写出对话记录和耗时
+JSONL每行：{"id": "d1", "turns": ["第一句", "第二句", ...]}
+"""
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def stream_reply(client, messages, model="glm-4", on_token=None, **kwargs):
+    """流式请求，返回（完整回复, 首字延迟秒数, 总耗时秒数）；on_token(delta)在每个增量到达时调用"""
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    for chunk in client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        parts.append(delta)
+        if on_token:
+            on_token(delta)
+    return "".join(parts), ttft, time.perf_counter() - start
+
+
+def print_token(delta):
+    print(delta, end='', flush=True)
+
+
+def load_dialogues(path):
+    dialogues = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for idx, line in enumerate(f):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            row.setdefault("id", f"dialogue-{idx}")
+            dialogues.append(row)
+    return dialogues
+
+
+def run_dialogue(client, dialogue, build_messages, model="glm-4"):
+    """
+    回放一段对话。build_messages(history, question) 返回本轮发给模型的messages，
+    history是这段对话自己的 [{"role", "content"}] 列表，与其他对话互不影响。
+    """
+    history = []
+    turns = []
+    start = time.perf_counter()
+    error = None
+    for question in dialogue["turns"]:
+        history.append({"role": "user", "content": question})
+        try:
+            reply, ttft, seconds = stream_reply(client, build_messages(history, question), model=model)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            break
+        history.append({"role": "assistant", "content": reply})
+        turns.append({"user": question, "assistant": reply,
+                      "ttft": round(ttft, 3) if ttft is not None else None, "seconds": round(seconds, 3)})
+    return {"id": dialogue.get("id"), "turns": turns, "total_seconds": round(time.perf_counter() - start, 3), "error": error}
+
+
+def replay_dialogues(client, dialogues, make_builder, output_path, workers=4, model="glm-4"):
+    """
+    并发回放多段对话，每段完成就追加一行到output_path。
+    make_builder() 为每段对话新建一个 build_messages（例如各自的历史窗口）。
+    """
+    results = []
+    with open(output_path, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run_dialogue, client, d, make_builder(), model): d for d in dialogues}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            status = "失败：" + result["error"] if result["error"] else "完成"
+            print(f"[{len(results)}/{len(dialogues)}] {result['id']} {len(result['turns'])}轮 {result['total_seconds']}秒 {status}",
+                  file=sys.stderr)
+    return results
@@ -0,0 +1,267 @@
+"""
+本地宠物养护FAQ检索：中文按字的1~2元组切词，BM25打分。
+- 离线构建：python faq_index.py build（faq.jsonl -> faq_index.bin）
+- 加载时mmap索引文件，只解析头部的词表，倒排表和答案按需从映射内存里读
+- 置信度高于阈值且明显领先第二名时直接返回库里的答案，不调用大模型；低一些时把最相关的几条作为参考资料放进提示词
+- 置信度只看条目被问到了多少，另用覆盖率（问题里被条目匹配到的字的比例）看问题有多少落在条目之外：
+  “疫苗什么时候打？它今天被车撞了腿流血了”这种夹带别的情况的长问题覆盖率低，不直接作答
+- 问题里提到猫或狗时只匹配同物种（或通用）的条目，避免“猫一天喂几次”命中狗的答案
+- 分幼年/成年的条目（age字段）同理只匹配同年龄段；问题没说年龄时这类条目不直接作答，交给模型结合上下文判断
+索引文件布局：MAGIC | 头部JSON长度(uint32) | 头部JSON | 倒排表（每项 文档号uint32 + BM25权重float32） | 答案UTF-8
+"""
+import argparse
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+
+PET_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FAQ_PATH = os.path.join(PET_DIR, "faq.jsonl")
+DEFAULT_INDEX_PATH = os.path.join(PET_DIR, "faq_index.bin")
+MAGIC = b"PETFAQ01"
+_POSTING = struct.Struct("<If")
+_TOKEN_RUN = re.compile(r'[一-鿿]+|[a-z0-9]+')
+_SPECIES_CHARS = {"狗": "dog", "犬": "dog", "猫": "cat"}
+_AGE_WORDS = {"幼犬": "young", "小狗": "young", "奶狗": "young", "幼猫": "young", "小猫": "young", "奶猫": "young",
+              "个月": "young", "月龄": "young",
+              "成年": "adult", "成犬": "adult", "成猫": "adult", "大狗": "adult", "老年": "adult", "老狗": "adult"}
+
+
+def tokenize(text):
+    """中文连续段取单字和相邻两字，英文/数字按整词"""
+    terms = []
+    for run in _TOKEN_RUN.findall(text.lower()):
+        if run[0].isascii():
+            terms.append(run)
+            continue
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def detect_species(text):
+    """问题只提到一种动物时返回dog/cat，否则None"""
+    found = {species for char, species in _SPECIES_CHARS.items() if char in text}
+    return found.pop() if len(found) == 1 else None
+
+
+def _coverage(text, terms):
+    """text里落在terms中的字的比例：单字命中，或与前后任一字组成的两字词命中都算"""
+    total = covered = 0
+    for run in _TOKEN_RUN.findall(text.lower()):
+        if run[0].isascii():
+            total += len(run)
+            covered += len(run) if run in terms else 0
+            continue
+        for i, char in enumerate(run):
+            total += 1
+            covered += (char in terms or (i > 0 and run[i - 1:i + 1] in terms)
+                        or (i + 1 < len(run) and run[i:i + 2] in terms))
+    return covered / total if total else 0.0
+
+
+def detect_age(text):
+    """问题只提到一个年龄段时返回young/adult，否则None"""
+    found = {age for word, age in _AGE_WORDS.items() if word in text}
+    return found.pop() if len(found) == 1 else None
+
+
+def load_faq(path=DEFAULT_FAQ_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_index(faq_path=DEFAULT_FAQ_PATH, index_path=DEFAULT_INDEX_PATH, k1=1.2, b=0.75):
+    """把FAQ的问题和别名建成BM25倒排索引写入index_path；返回条目数"""
+    entries = load_faq(faq_path)
+    doc_terms = []
+    for entry in entries:
+        counts = {}
+        for text in [entry["question"]] + entry.get("aliases", []):
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+        doc_terms.append(counts)
+
+    n_docs = len(entries)
+    doc_lens = [sum(counts.values()) for counts in doc_terms]
+    avgdl = sum(doc_lens) / n_docs if n_docs else 0.0
+    postings = {}
+    for doc_id, counts in enumerate(doc_terms):
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc_id, tf))
+
+    weights = {}
+    for term, plist in postings.items():
+        idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+        weights[term] = [(doc_id, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_lens[doc_id] / avgdl)))
+                         for doc_id, tf in plist]
+
+    # 每条FAQ用自己的各个问法打分，取最低分作为置信度的分母：用户原样问出任一问法时置信度为1
+    def score(text, doc_id):
+        return sum(w for term in set(tokenize(text)) for d, w in weights.get(term, []) if d == doc_id)
+
+    terms = {}
+    posting_blob = bytearray()
+    for term in sorted(weights):
+        terms[term] = [len(posting_blob) // _POSTING.size, len(weights[term])]
+        for doc_id, weight in weights[term]:
+            posting_blob += _POSTING.pack(doc_id, weight)
+
+    answer_blob = bytearray()
+    docs = []
+    for doc_id, entry in enumerate(entries):
+        answer = entry["answer"].encode('utf-8')
+        variants = [entry["question"]] + entry.get("aliases", [])
+        docs.append({"id": entry["id"], "question": entry["question"], "species": entry.get("species"),
+                     "age": entry.get("age"),
+                     "self_score": min(score(text, doc_id) for text in variants),
+                     "answer_offset": len(answer_blob), "answer_len": len(answer)})
+        answer_blob += answer
+
+    header = {"version": 1, "k1": k1, "b": b, "source_sha256": _file_sha256(faq_path),
+              "docs": docs, "terms": terms, "postings_bytes": len(posting_blob)}
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(posting_blob)
+        f.write(answer_blob)
+    os.replace(tmp_path, index_path)
+    return n_docs
+
+
+class FAQIndex:
+    """只读索引，线程安全；用from_file加载"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        if bytes(self._view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"不是FAQ索引文件：{path}")
+        (header_len,) = struct.unpack_from("<I", self._view, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        header = json.loads(bytes(self._view[header_start:header_start + header_len]).decode('utf-8'))
+        self.source_sha256 = header["source_sha256"]
+        self.docs = header["docs"]
+        self._terms = header["terms"]
+        self._postings_start = header_start + header_len
+        self._answers_start = self._postings_start + header["postings_bytes"]
+
+    @classmethod
+    def from_file(cls, index_path=None, faq_path=None):
+        """加载索引；索引不存在或FAQ内容已变时先重新构建"""
+        index_path = index_path or os.getenv("FAQ_INDEX_PATH") or DEFAULT_INDEX_PATH
+        faq_path = faq_path or os.getenv("FAQ_PATH") or DEFAULT_FAQ_PATH
+        if not os.path.exists(index_path):
+            build_index(faq_path, index_path)
+        index = cls(index_path)
+        if os.path.exists(faq_path) and index.source_sha256 != _file_sha256(faq_path):
+            index.close()
+            build_index(faq_path, index_path)
+            index = cls(index_path)
+        return index
+
+    def _postings(self, term):
+        entry = self._terms.get(term)
+        if entry is None:
+            return ()
+        start = self._postings_start + entry[0] * _POSTING.size
+        return _POSTING.iter_unpack(self._view[start:start + entry[1] * _POSTING.size])
+
+    def search(self, query, top_k=3):
+        """
+        返回按分数降序的 [{"doc", "id", "question", "score", "confidence", "coverage"}]。
+        confidence：条目自身的问法被问到了多少；coverage：问题里有多大比例的字落在该条目匹配到的词里。
+        """
+        species = detect_species(query)
+        age = detect_age(query)
+        scores = {}
+        matched = {}  # doc_id -> 该条目匹配到的查询词
+        for term in set(tokenize(query)):
+            for doc_id, weight in self._postings(term):
+                doc = self.docs[doc_id]
+                if species and doc["species"] and doc["species"] != species:
+                    continue
+                if age and doc.get("age") and doc["age"] != age:
+                    continue
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+                matched.setdefault(doc_id, set()).add(term)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        results = []
+        for doc_id, score in ranked:
+            doc = self.docs[doc_id]
+            confidence = min(1.0, score / doc["self_score"]) if doc["self_score"] else 0.0
+            coverage = _coverage(query, matched[doc_id])
+            results.append({"doc": doc_id, "id": doc["id"], "question": doc["question"],
+                            "score": score, "confidence": confidence, "coverage": coverage,
+                            "age_matched": not doc.get("age") or doc["age"] == age})
+        return results
+
+    def lookup(self, query, answer_threshold=0.8, context_threshold=0.35, top_k=3, margin=0.8,
+               coverage_threshold=0.65):
+        """
+        返回dict：answer（可直接作答时为库里的答案，否则None）/ hit（直接作答命中的条目）/
+        passages（置信度达到context_threshold、可作为参考资料的条目）/ results（全部检索结果）。
+        直接作答要求第一名置信度达到answer_threshold、覆盖率达到coverage_threshold（问题里没有条目管不到的内容），
+        且第二名分数不超过第一名的margin倍、置信度也没达到answer_threshold（问题有歧义或同时问了两件事时交给模型）；
+        分年龄段的条目还要求问题说明了同一个年龄段。
+        """
+        results = self.search(query, top_k)
+        top = results[0] if results else None
+        runner_up = results[1] if len(results) > 1 else None
+        answerable = (top is not None and top["confidence"] >= answer_threshold
+                      and top["coverage"] >= coverage_threshold and top["age_matched"]
+                      and (runner_up is None or (runner_up["score"] <= top["score"] * margin
+                                                 and runner_up["confidence"] < answer_threshold)))
+        return {
+            "answer": self.answer(top["doc"]) if answerable else None,
+            "hit": top if answerable else None,
+            "passages": [r for r in results if r["confidence"] >= context_threshold],
+            "results": results,
+        }
+
+    def answer(self, doc_id):
+        doc = self.docs[doc_id]
+        start = self._answers_start + doc["answer_offset"]
+        return bytes(self._view[start:start + doc["answer_len"]]).decode('utf-8')
+
+    def close(self):
+        self._view.release()
+        self._mm.close()
+
+
+def format_passages(index, results):
+    """把检索结果整理成放进系统提示词的参考资料"""
+    return "\n".join(f"- 问：{r['question']}\n  答：{index.answer(r['doc'])}" for r in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建/查询本地宠物养护FAQ索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build")
+    build_parser.add_argument("--faq", default=DEFAULT_FAQ_PATH)
+    build_parser.add_argument("--out", default=DEFAULT_INDEX_PATH)
+    query_parser = sub.add_parser("query")
+    query_parser.add_argument("text")
+    query_parser.add_argument("--index", default=DEFAULT_INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(args.faq, args.out)
+        print(f"已构建 {count} 条FAQ -> {args.out}（{os.path.getsize(args.out) / 1024:.1f} KB）")
+    else:
+        faq = FAQIndex(args.index)
+        for r in faq.search(args.text):
+            print(f"{r['confidence']:.2f}  {r['coverage']:.2f}  {r['score']:.2f}  {r['id']}  {r['question']}")
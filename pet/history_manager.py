@@ -0,0 +1,106 @@
+"""对话历史窗口：最近几轮原文保留在token预算内，更早的轮次增量折叠进滚动摘要"""
+import re
+
+_CJK = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗略估算token数：中文约1字1token，其余约4字符1token"""
+    if not isinstance(text, str):
+        # 多模态消息只统计其中的文字部分
+        text = " ".join(part.get("text", "") for part in text if isinstance(part, dict))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 4
+
+
+def extractive_summary(previous_summary, messages, max_chars=400):
+    """不调模型的兜底摘要：每条消息截取开头，拼到旧摘要后面，超长时保留最新部分"""
+    role_names = {"user": "用户", "assistant": "助手"}
+    lines = [previous_summary] if previous_summary else []
+    for msg in messages:
+        content = re.sub(r'\s+', ' ', str(msg["content"])).strip()
+        lines.append(f"{role_names.get(msg['role'], msg['role'])}：{content[:60]}")
+    summary = "；".join(lines)
+    return summary[-max_chars:]
+
+
+def llm_summarizer(client, model="glm-4"):
+    """用对话模型把新折叠的消息合并进旧摘要"""
+    def summarize(previous_summary, messages):
+        dialogue = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": "你负责压缩对话记录。把新增对话合并进已有摘要，保留宠物品种、症状、用户问过的问题和给出的关键建议，150字以内，只输出摘要。"},
+                {"role": "user", "content": f"已有摘要：{previous_summary or '无'}\n\n新增对话：\n{dialogue}"},
+            ],
+            temperature=0.1,
+        )
+        return response.choices[0].message.content.strip()
+    return summarize
+
+
+class HistoryWindow:
+    """
+    维护一份增量摘要：已折叠的消息数记在folded_count，之后只把新超出预算的消息
+    交给summarize_fn(旧摘要, 新折叠的消息)合并，不会每轮从头重算。
+    """
+
+    def __init__(self, token_budget=1500, summarize_fn=None, fold_ratio=0.7, summary_max_chars=400):
+        self.token_budget = token_budget
+        self.summarize_fn = summarize_fn
+        # 超预算时一次折叠到预算的70%，避免每轮都触发摘要请求
+        self.fold_ratio = fold_ratio
+        self.summary_max_chars = summary_max_chars
+        self.summary = ""
+        self.folded_count = 0
+
+    def reset(self):
+        self.summary = ""
+        self.folded_count = 0
+
+    def _fold(self, messages):
+        if self.summarize_fn:
+            try:
+                summary = self.summarize_fn(self.summary, messages)
+                if summary:
+                    self.summary = summary[-self.summary_max_chars:]
+                    return
+            except Exception:
+                pass
+        self.summary = extractive_summary(self.summary, messages, self.summary_max_chars)
+
+    def build(self, history):
+        """返回（摘要, 需要原文发送的最近消息列表）"""
+        if len(history) < self.folded_count:
+            # 历史被清空或截短，摘要作废
+            self.reset()
+
+        # 只取未折叠的部分；history可以是列表，也可以是按需查库的StoredHistory
+        recent = list(history[self.folded_count:])
+        sizes = [estimate_tokens(msg["content"]) for msg in recent]
+        if sum(sizes) > self.token_budget:
+            # 从最新往前保留，直到占满fold_ratio比例的预算
+            target = self.token_budget * self.fold_ratio
+            keep_from = len(recent)
+            used = 0
+            while keep_from > 0 and used + sizes[keep_from - 1] <= target:
+                keep_from -= 1
+                used += sizes[keep_from]
+            # 至少保留最后一条；并尽量从用户消息开始，不把一问一答拆开
+            keep_from = min(keep_from, len(recent) - 1)
+            while keep_from < len(recent) - 1 and recent[keep_from]["role"] != "user":
+                keep_from += 1
+            if keep_from > 0:
+                self._fold(recent[:keep_from])
+                self.folded_count += keep_from
+                recent = recent[keep_from:]
+
+        return self.summary, [{"role": msg["role"], "content": msg["content"]} for msg in recent]
+
+    def to_messages(self, system_prompt, history):
+        """拼出发给模型的messages：系统提示（附摘要）+ 最近的原文历史"""
+        summary, recent = self.build(history)
+        if summary:
+            system_prompt = f"{system_prompt}\n\n更早对话的摘要：{summary}"
+        return [{"role": "system", "content": system_prompt}] + recent
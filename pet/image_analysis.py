@@ -0,0 +1,195 @@
+"""
+照片结构化分析：每张图（按内容哈希）只调用一次视觉模型，得到物种/品种/可见状况等JSON，
+之后的追问交给文本模型并附上这份分析；只有问题需要重新看像素时才再走视觉模型。
+"""
+import json
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from intent_engine import IntentEngine
+
+ANALYSIS_PROMPT = (
+    "请仔细观察这张照片，只输出一个JSON对象，不要输出其他文字。字段："
+    '{"species": "物种", "breed": "品种（不确定时给出最可能的1-2个）", "confidence": "高/中/低", '
+    '"coat": "毛色与毛发状况", "body": "体型、年龄段、体态", '
+    '"visible_conditions": ["照片中可见的健康相关状况，如眼屎、皮肤发红、脱毛、伤口，没有则为空列表"], '
+    '"scene": "拍摄环境", "notes": "其他值得注意的细节"}'
+)
+
+# 这些说法意味着要重新看照片本身，文字分析不够用
+PIXEL_KEYWORDS = [
+    "看看", "看一下", "仔细看", "放大", "图里", "图片里", "照片里", "图中", "照片中",
+    "颜色", "毛色", "长什么样", "这个部位", "这块", "这里", "左边", "右边", "背景",
+    "伤口", "红肿", "发红", "皮肤", "眼睛", "耳朵里", "牙齿", "斑点", "肿块",
+]
+_pixel_engine = IntentEngine({"intents": {"pixels": {"keywords": PIXEL_KEYWORDS}}, "ignore": ["其它", "其他"]})
+
+_JSON_BLOCK = re.compile(r'\{.*\}', re.S)
+FIELD_NAMES = [
+    ("species", "物种"), ("breed", "品种"), ("confidence", "把握"), ("coat", "毛色"),
+    ("body", "体态"), ("visible_conditions", "可见状况"), ("scene", "环境"), ("notes", "备注"),
+]
+
+
+def needs_pixels(question):
+    """问题里提到具体部位、颜色、“看看”等时需要把照片再发给视觉模型"""
+    return _pixel_engine.detect(question) == "pixels"
+
+
+def build_analysis_messages(image_data_url):
+    return [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": ANALYSIS_PROMPT},
+            {"type": "image_url", "image_url": {"url": image_data_url}},
+        ],
+    }]
+
+
+def parse_analysis(text):
+    """从模型输出里取出JSON；解析失败时把原文放进notes，仍可作为上下文使用"""
+    match = _JSON_BLOCK.search(text or "")
+    if match:
+        try:
+            data = json.loads(match.group(0))
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+    return {"notes": (text or "").strip()}
+
+
+def analysis_to_context(analysis):
+    """把分析结果写成给文本模型看的一段说明"""
+    lines = []
+    for field, label in FIELD_NAMES:
+        value = analysis.get(field)
+        if not value:
+            continue
+        if isinstance(value, list):
+            value = "、".join(str(v) for v in value)
+        lines.append(f"{label}：{value}")
+    return "\n".join(lines)
+
+
+def analysis_caption(analysis):
+    """侧边栏一行摘要"""
+    parts = [str(analysis[field]) for field in ("species", "breed") if analysis.get(field)]
+    conditions = analysis.get("visible_conditions")
+    if isinstance(conditions, list):
+        conditions = "、".join(str(c) for c in conditions)
+    if conditions:
+        parts.append(f"可见：{conditions}")
+    return " · ".join(parts)
+
+
+class ImageAnalysisCache:
+    """按图片内容哈希缓存分析结果，进程内LRU，所有会话共享"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def __contains__(self, image_hash):
+        with self._lock:
+            return image_hash in self._entries
+
+    def get(self, image_hash):
+        with self._lock:
+            analysis = self._entries.get(image_hash)
+            if analysis is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(image_hash)
+            self.stats["hits"] += 1
+            return analysis
+
+    def put(self, image_hash, analysis):
+        with self._lock:
+            self._entries[image_hash] = analysis
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class AnalysisPrefetcher:
+    """
+    新照片一上传就在后台开始分析（第一个问题几乎总是“这是什么品种”）。
+    第一个问题到达时：已分析完直接读缓存，还在进行就等这一次，不重复请求。
+    同一张图被多个会话预取时共用一次，所有会话都放弃（换图/删图）后才取消；
+    取消只对还在排队的请求生效，已经发出的请求照常完成并写入缓存。
+    """
+
+    def __init__(self, cache, max_workers=2):
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-prefetch")
+        self._lock = threading.Lock()
+        self._pending = {}  # image_hash -> [Future, 取消Event, 等结果的会话集合]
+        self.stats = {"started": 0, "joined": 0, "cancelled": 0, "failed": 0}
+
+    def start(self, image_hash, owner, fetch):
+        """后台执行fetch(cancel_event)；结果已在缓存或同一张图已在预取时不重复发起"""
+        if image_hash in self.cache:
+            return
+        with self._lock:
+            entry = self._pending.get(image_hash)
+            if entry is not None:
+                entry[2].add(owner)
+                return
+            cancel = threading.Event()
+            entry = [None, cancel, {owner}]
+            self._pending[image_hash] = entry
+            self.stats["started"] += 1
+            entry[0] = self._pool.submit(self._run, image_hash, fetch, cancel)
+
+    def _run(self, image_hash, fetch, cancel):
+        try:
+            return fetch(cancel)
+        except Exception:
+            if not cancel.is_set():
+                with self._lock:
+                    self.stats["failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                entry = self._pending.get(image_hash)
+                if entry is not None and entry[1] is cancel:
+                    del self._pending[image_hash]
+
+    def cancel(self, image_hash, owner):
+        """owner不再需要这张图的预取；没有其他会话在等时取消"""
+        with self._lock:
+            entry = self._pending.get(image_hash)
+            if entry is None:
+                return
+            entry[2].discard(owner)
+            if entry[2]:
+                return
+            del self._pending[image_hash]
+            self.stats["cancelled"] += 1
+        entry[1].set()
+        entry[0].cancel()
+
+    def pending(self, image_hash):
+        with self._lock:
+            return image_hash in self._pending
+
+    def wait(self, image_hash, timeout=None):
+        """有在途的预取时等它完成并返回分析结果；没有在途、失败或被取消时返回None"""
+        with self._lock:
+            entry = self._pending.get(image_hash)
+            if entry is None:
+                return None
+            self.stats["joined"] += 1
+        try:
+            return entry[0].result(timeout)
+        except Exception:
+            return None
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._pending))
@@ -0,0 +1,123 @@
+"""视觉请求前的图片预处理：按EXIF方向摆正、限制最长边、按质量重新编码、识别真实MIME"""
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 没装Pillow时只做MIME识别，不缩放
+    Image = None
+
+DEFAULT_MAX_EDGE = 1024
+DEFAULT_QUALITY = 85
+CACHE_SIZE = 64
+# 视觉模型直接支持的格式，其余（webp/gif/bmp等）一律转码
+DIRECT_MIMES = ("image/jpeg", "image/png")
+
+# 文件头魔数 -> MIME
+_MAGIC = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def detect_mime(data):
+    """根据文件头判断图片类型，不依赖文件扩展名"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    return "application/octet-stream"
+
+
+def _has_alpha(img):
+    return img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+
+
+def _reencode(data, max_edge, quality):
+    """返回（重新编码后的字节, MIME, 宽, 高）；无需处理时原样返回"""
+    mime = detect_mime(data)
+    if Image is None:
+        return data, mime, None, None
+
+    img = Image.open(io.BytesIO(data))
+    # EXIF方向标记（0x0112）不为1说明手机照片需要摆正
+    rotated = img.getexif().get(0x0112, 1) != 1
+    img = ImageOps.exif_transpose(img)
+    transposed_size = img.size
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if _has_alpha(img):
+        # 带透明通道的保留PNG，避免透明区域变黑
+        img.save(out, format="PNG", optimize=True)
+        out_mime = "image/png"
+    else:
+        img.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+        out_mime = "image/jpeg"
+    encoded = out.getvalue()
+
+    # 原图格式模型可直接识别、无需摆正且重新编码并不更小时，保留原图
+    if mime in DIRECT_MIMES and not rotated and len(encoded) >= len(data):
+        return data, mime, transposed_size[0], transposed_size[1]
+    return encoded, out_mime, img.width, img.height
+
+
+def preprocess_image(data, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY, cache=True):
+    """
+    预处理图片字节，返回dict：
+    data（重新编码后的原始字节）/ mime / hash / width / height / original_bytes / encoded_bytes / saved_bytes
+    cache=True时结果按内容哈希+参数缓存，同一张图重复处理不会重复编码；
+    缓存里存着整份字节，调用方自己管理字节（如BlobManager）或每张图只处理一次时应传cache=False。
+    只保存原始字节，base64比原始字节大1/3，发请求前再用to_data_url编码。
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    cache_key = (content_hash, max_edge, quality)
+    if cache:
+        with _cache_lock:
+            if cache_key in _cache:
+                _cache.move_to_end(cache_key)
+                return _cache[cache_key]
+
+    encoded, mime, width, height = _reencode(data, max_edge, quality)
+    result = {
+        "data": encoded,
+        "mime": mime,
+        "hash": content_hash,
+        "width": width,
+        "height": height,
+        "original_bytes": len(data),
+        "encoded_bytes": len(encoded),
+        "saved_bytes": len(data) - len(encoded),
+    }
+    if cache:
+        with _cache_lock:
+            _cache[cache_key] = result
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return result
+
+
+def to_data_url(prepared):
+    return f"data:{prepared['mime']};base64,{base64.b64encode(prepared['data']).decode('utf-8')}"
+
+
+def data_url_bytes(data_url):
+    """data URL里base64负载解码后的字节数（不用真的解码）"""
+    payload = data_url.partition(",")[2]
+    return len(payload) * 3 // 4 - payload[-2:].count("=")
+
+
+def preprocess_image_file(image_path, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY, cache=True):
+    with open(image_path, 'rb') as image_file:
+        return preprocess_image(image_file.read(), max_edge, quality, cache)
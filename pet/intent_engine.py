@@ -0,0 +1,134 @@
+"""
+意图识别引擎：所有关键词预编译成一个Aho-Corasick自动机，一次扫描找出全部命中，
+重叠命中取最左最长，再按意图累计权重打分并给出置信度。
+关键词表放在intents.json里，改关键词不用改代码（也可用环境变量 INTENT_CONFIG 指定其他文件）。
+"""
+import json
+import os
+from collections import deque
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents.json")
+
+
+class AhoCorasick:
+    """多模式串匹配自动机：构建一次，之后每条输入只需扫描一遍"""
+
+    def __init__(self, patterns):
+        # 每个状态：goto子节点、失败指针、在此结束的模式串
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build_fail_links()
+
+    def _add(self, pattern):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        if pattern not in self._out[state]:
+            self._out[state].append(pattern)
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text):
+        """返回全部命中 (起始位置, 结束位置, 模式串)，允许重叠"""
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for pattern in self._out[state]:
+                matches.append((i - len(pattern) + 1, i + 1, pattern))
+        return matches
+
+
+def select_longest(matches):
+    """重叠命中只保留最左最长的那个，例如“之前的问题”不再同时算“之前”"""
+    selected = []
+    last_end = -1
+    for start, end, pattern in sorted(matches, key=lambda m: (m[0], -(m[1] - m[0]))):
+        if start >= last_end:
+            selected.append((start, end, pattern))
+            last_end = end
+    return selected
+
+
+class IntentEngine:
+    """
+    config格式：
+    {
+      "default_intent": "default",
+      "intents": {"history": {"priority": 2, "keywords": ["之前", ...] 或 {"之前": 2.0, ...}}},
+      "ignore": ["其它"]    # 只占位不计分，防止“其它”里的“它”被误判
+    }
+    关键词默认权重为字数，越长越具体；同分时priority高的意图优先。
+    同一个关键词只能属于一个意图（或忽略词），重复时抛ValueError，避免后面的意图悄悄覆盖前面的。
+    """
+
+    def __init__(self, config):
+        self.default_intent = config.get("default_intent", "default")
+        self.priority = {}
+        self.keyword_table = {}  # 关键词 -> (意图, 权重)，意图为None表示忽略词
+        for intent, spec in config.get("intents", {}).items():
+            self.priority[intent] = spec.get("priority", 0)
+            keywords = spec.get("keywords", [])
+            if isinstance(keywords, dict):
+                items = keywords.items()
+            else:
+                items = ((kw, float(len(kw))) for kw in keywords)
+            for keyword, weight in items:
+                self._add_keyword(keyword, intent, float(weight))
+        for keyword in config.get("ignore", []):
+            self._add_keyword(keyword, None, 0.0)
+        self.automaton = AhoCorasick(self.keyword_table.keys())
+
+    def _add_keyword(self, keyword, intent, weight):
+        existing = self.keyword_table.get(keyword)
+        if existing is not None and existing[0] != intent:
+            names = ["ignore" if name is None else name for name in (existing[0], intent)]
+            raise ValueError(f"关键词“{keyword}”同时出现在 {names[0]} 和 {names[1]} 里")
+        self.keyword_table[keyword] = (intent, weight)
+
+    @classmethod
+    def from_file(cls, path=None):
+        path = path or os.getenv("INTENT_CONFIG") or DEFAULT_CONFIG_PATH
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def classify(self, text):
+        """返回（意图, 置信度0~1, 命中的关键词列表）"""
+        matches = select_longest(self.automaton.find_all(text))
+        scores = {}
+        hits = []
+        for _, _, keyword in matches:
+            intent, weight = self.keyword_table[keyword]
+            if intent is None:
+                continue
+            scores[intent] = scores.get(intent, 0.0) + weight
+            hits.append(keyword)
+        if not scores:
+            return self.default_intent, 1.0, hits
+        best = max(scores, key=lambda intent: (scores[intent], self.priority.get(intent, 0)))
+        return best, scores[best] / sum(scores.values()), hits
+
+    def detect(self, text):
+        return self.classify(text)[0]
@@ -0,0 +1,304 @@
+"""
+统一的大模型客户端：所有脚本共用一个进程级实例。
+- 复用httpx连接池，不再每个脚本各建一个客户端
+- 每次调用有总截止时间（含排队和重试）
+- 429/5xx/超时/断连按带抖动的指数退避重试
+- 信号量限制同时在途的请求数
+- 同步 create() 与 asyncio 的 acreate() 两套入口
+基础地址可用环境变量 ZHIPU_BASE_URL 指向本地模拟服务器做测试。
+"""
+import asyncio
+import functools
+import os
+import random
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+
+import httpx
+
+try:
+    from zhipuai import ZhipuAI as _SDKClient
+except ImportError:  # 新版SDK（zai-sdk）
+    from zai import ZhipuAiClient as _SDKClient
+
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+DEFAULT_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# 这些状态码值得重试：限流和服务端错误
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """在截止时间内没有拿到结果（包括排队等待和重试）"""
+
+
+def is_retryable(exc):
+    """判断异常是否值得重试：限流、5xx、超时、连接错误"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    name = type(exc).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """全抖动指数退避：在[0, min(cap, base·2^attempt)]之间随机，避免大量请求同时重试"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RateLimiter:
+    """令牌桶限速：平均每秒rate个请求，允许burst个突发；rate为0或None时不限速；线程安全"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate) if rate else None
+        self.capacity = float(burst if burst is not None else max(1.0, self.rate or 1.0))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """预定一个令牌，返回需要等待的秒数"""
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def _release_when_done(semaphore, future):
+    """线程里的调用结束后归还asyncio并发名额；调用方已超时放弃时顺带取走异常，避免未取回的告警"""
+    semaphore.release()
+    if not future.cancelled():
+        future.exception()
+
+
+class _HeldStream:
+    """
+    流式响应的包装，占着一个并发名额：读完、读取出错或调用close()时释放（只释放一次），
+    上游有close()时一并关闭；拿到后不读也不close的，对象被回收时兜底释放。
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._iter = None
+        self._release = release
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        try:
+            if self._iter is None:
+                self._iter = iter(self._stream)
+            return next(self._iter)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        if not getattr(self, "_closed", True):
+            self.close()
+
+
+class LLMClient:
+    """
+    对SDK客户端的一层包装，对外保持 client.chat.completions.create(...) 的用法不变。
+    sdk_client可以传入任意实现了chat.completions.create的对象（如本地假客户端）。
+    """
+
+    def __init__(self, api_key=None, base_url=None, timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, sdk_client=None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self._http_client = None
+        if sdk_client is None:
+            sdk_client = self._build_sdk_client(api_key, base_url)
+        self._sdk_client = sdk_client
+        self.stats = {"calls": 0, "retries": 0, "failures": 0}
+        self._stats_lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _build_sdk_client(self, api_key, base_url):
+        # 连接池大小与并发上限匹配，空闲连接保持复用
+        self._http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=self.max_concurrency * 2,
+                                max_keepalive_connections=self.max_concurrency),
+            timeout=self.timeout,
+        )
+        kwargs = {"api_key": api_key, "timeout": self.timeout, "max_retries": 0, "http_client": self._http_client}
+        if base_url:
+            kwargs["base_url"] = base_url
+        return _SDKClient(**kwargs)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    # ---------- 同步入口 ----------
+    def create(self, deadline=None, **kwargs):
+        """
+        同步调用 chat.completions.create。
+        deadline为本次调用总耗时上限（秒），默认等于timeout；
+        stream=True时返回的迭代器读完、出错或close()后才释放并发名额，中途放弃读取时应调用close()。
+        """
+        budget = deadline if deadline is not None else self.timeout
+        end_time = time.monotonic() + budget
+        stream = kwargs.get("stream", False)
+        attempt = 0
+        while True:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0 or not self._semaphore.acquire(timeout=remaining):
+                self._count("failures")
+                raise LLMDeadlineExceeded(f"大模型调用超过截止时间 {budget:.1f} 秒")
+            released = False
+            try:
+                self._count("calls")
+                result = self._sdk_client.chat.completions.create(timeout=max(end_time - time.monotonic(), 0.1), **kwargs)
+                if stream:
+                    released = True
+                    return _HeldStream(result, self._semaphore.release)
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+                delay = backoff_delay(attempt)
+                if time.monotonic() + delay >= end_time:
+                    self._count("failures")
+                    raise
+            finally:
+                if not released:
+                    self._semaphore.release()
+            attempt += 1
+            self._count("retries")
+            time.sleep(delay)
+
+    # ---------- asyncio入口 ----------
+    def _async_semaphore(self):
+        loop = asyncio.get_running_loop()
+        sem = self._async_semaphores.get(loop)
+        if sem is None:
+            sem = asyncio.Semaphore(self.max_concurrency)
+            self._async_semaphores[loop] = sem
+        return sem
+
+    async def acreate(self, deadline=None, **kwargs):
+        """
+        asyncio版本：SDK是同步的，放到线程池里执行，用asyncio信号量和截止时间控制。
+        超时后线程里的调用停不下来，并发名额要等线程真正结束才归还，在途调用数不会超过max_concurrency。
+        """
+        if kwargs.get("stream"):
+            raise ValueError("acreate暂不支持stream=True，请在线程中使用同步create")
+        budget = deadline if deadline is not None else self.timeout
+        end_time = time.monotonic() + budget
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphore()
+        attempt = 0
+        while True:
+            try:
+                remaining = end_time - time.monotonic()
+                if remaining <= 0:
+                    raise LLMDeadlineExceeded(f"大模型调用超过截止时间 {budget:.1f} 秒")
+                await asyncio.wait_for(semaphore.acquire(), timeout=remaining)
+                remaining = end_time - time.monotonic()
+                if remaining <= 0:
+                    semaphore.release()
+                    raise LLMDeadlineExceeded(f"大模型调用超过截止时间 {budget:.1f} 秒")
+                self._count("calls")
+                call = functools.partial(self._sdk_client.chat.completions.create, timeout=remaining, **kwargs)
+                future = loop.run_in_executor(None, call)
+                future.add_done_callback(functools.partial(_release_when_done, semaphore))
+                # shield：超时只放弃等待，不取消future，名额由回调在线程结束时归还
+                return await asyncio.wait_for(asyncio.shield(future), timeout=remaining)
+            except asyncio.TimeoutError:
+                self._count("failures")
+                raise LLMDeadlineExceeded(f"大模型调用超过截止时间 {budget:.1f} 秒")
+            except LLMDeadlineExceeded:
+                self._count("failures")
+                raise
+            except Exception as e:
+                delay = backoff_delay(attempt)
+                if attempt >= self.max_retries or not is_retryable(e) or time.monotonic() + delay >= end_time:
+                    self._count("failures")
+                    raise
+            attempt += 1
+            self._count("retries")
+            await asyncio.sleep(delay)
+
+    def close(self):
+        if self._http_client is not None:
+            self._http_client.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(api_key=None, base_url=None, **kwargs):
+    """按（api_key, base_url）返回进程级共享客户端，Streamlit每次rerun也不会重建"""
+    api_key = api_key or os.getenv("ZHIPU_API_KEY")
+    base_url = base_url or os.getenv("ZHIPU_BASE_URL") or None
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = LLMClient(api_key=api_key, base_url=base_url, **kwargs)
+            _clients[key] = client
+        return client
+
+
+def set_llm_client(client, api_key=None, base_url=None):
+    """把（api_key, base_url）对应的共享客户端替换成指定实例，压测时用来注入本地替身"""
+    api_key = api_key or os.getenv("ZHIPU_API_KEY")
+    base_url = base_url or os.getenv("ZHIPU_BASE_URL") or None
+    with _clients_lock:
+        _clients[(api_key, base_url)] = client
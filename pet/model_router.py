@@ -0,0 +1,138 @@
+"""
+按轮选择模型和负载的路由层：
+- 负载：照片与问题相关时，已有结构化分析就只附分析文字（analysis），问到细节或还没有分析时才发图（image），否则不带图（none）
+- 模型档位（model_routes.json）：简单短问题走light，复杂或长问题走standard，发图走vision
+- 每条路由、每个档位按滚动窗口记录延迟、错误率和估算费用；某档位p95或错误率超标时改用它的fallback档位，
+  窗口里的样本过期后自动恢复
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from intent_engine import IntentEngine
+from telemetry import percentile
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_routes.json")
+
+
+class ModelRouter:
+    """进程级共享，线程安全"""
+
+    def __init__(self, config):
+        self.tiers = config["tiers"]
+        self.simple_max_tokens = config.get("simple_max_tokens", 24)
+        self.window_size = config.get("window_size", 50)
+        self.window_seconds = config.get("window_seconds", 600)
+        self.min_samples = config.get("min_samples", 5)
+        self._complex = IntentEngine({"intents": {"complex": {"keywords": config.get("complex_keywords", [])}}})
+        self._lock = threading.Lock()
+        self._tier_samples = {name: deque(maxlen=self.window_size) for name in self.tiers}
+        self._route_samples = {}  # 路由名 -> deque[(时间, 秒, 费用, 是否成功)]
+
+    @classmethod
+    def from_file(cls, path=None):
+        path = path or os.getenv("MODEL_ROUTES_CONFIG") or DEFAULT_CONFIG_PATH
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def is_complex(self, question, tokens):
+        """问题较长或含“为什么/怎么办/区别”等需要推理的说法"""
+        return tokens > self.simple_max_tokens or bool(self._complex.classify(question)[2])
+
+    def route(self, question, tokens, image_relevant=False, has_analysis=False, needs_pixels=False, intent=None):
+        """
+        返回dict：name / tier / model / payload（image/analysis/none） / reason
+        tokens是问题的估算token数；intent为history时按复杂问题处理（要读懂较长的历史）。
+        """
+        reasons = []
+        if image_relevant and (needs_pixels or not has_analysis):
+            tier, payload = "vision", "image"
+            reasons.append("需要看照片细节" if has_analysis else "还没有照片分析")
+        else:
+            payload = "analysis" if image_relevant else "none"
+            if intent == "history" or self.is_complex(question, tokens):
+                tier = "standard"
+                reasons.append("回溯历史" if intent == "history" else "复杂问题")
+            else:
+                tier = "light"
+                reasons.append("简短问题")
+
+        if not self.healthy(tier):
+            fallback = self.tiers[tier].get("fallback")
+            if tier == "vision" and has_analysis:
+                # 视觉档位变慢时，已有分析的照片改用文字分析回答
+                tier, payload = "standard", "analysis"
+                reasons.append("视觉模型降级，改用照片分析")
+            elif fallback and self.healthy(fallback):
+                reasons.append(f"{tier}档位降级，改用{fallback}")
+                tier = fallback
+
+        return {"name": f"{tier}/{payload}", "tier": tier, "model": self.tiers[tier]["model"],
+                "payload": payload, "reason": "，".join(reasons)}
+
+    def estimate_cost(self, route, tokens):
+        """按档位单价估算费用（元）；发图时另加图片折算的token数"""
+        tier = self.tiers[route["tier"]]
+        if route["payload"] == "image":
+            tokens += tier.get("image_tokens", 0)
+        return tokens / 1000 * tier.get("price_per_1k_tokens", 0.0)
+
+    def observe(self, route, seconds, tokens, ok=True):
+        """记录一次真实请求（缓存命中的不要记录）的耗时、token数和是否成功"""
+        sample = (time.monotonic(), seconds, self.estimate_cost(route, tokens), ok)
+        with self._lock:
+            self._tier_samples[route["tier"]].append(sample)
+            self._route_samples.setdefault(route["name"], deque(maxlen=self.window_size)).append(sample)
+
+    def _recent(self, samples):
+        cutoff = time.monotonic() - self.window_seconds
+        return [s for s in samples if s[0] >= cutoff]
+
+    def healthy(self, tier):
+        """样本不足时视为健康；p95延迟或错误率超过档位上限时视为降级"""
+        with self._lock:
+            samples = self._recent(self._tier_samples[tier])
+        if len(samples) < self.min_samples:
+            return True
+        config = self.tiers[tier]
+        error_rate = sum(1 for s in samples if not s[3]) / len(samples)
+        p95 = percentile([s[1] for s in samples if s[3]], 95)
+        if error_rate > config.get("max_error_rate", 1.0):
+            return False
+        return p95 is None or p95 <= config.get("max_p95_seconds", float("inf"))
+
+    def summary(self):
+        """每条路由最近窗口内的次数、p50/p95延迟、错误率和平均费用，外加各档位是否健康"""
+        with self._lock:
+            routes = {name: self._recent(samples) for name, samples in self._route_samples.items()}
+        result = {}
+        for name, samples in sorted(routes.items()):
+            if not samples:
+                continue
+            latencies = [s[1] for s in samples if s[3]]
+            result[name] = {
+                "count": len(samples),
+                "p50": percentile(latencies, 50) or 0.0,
+                "p95": percentile(latencies, 95) or 0.0,
+                "error_rate": sum(1 for s in samples if not s[3]) / len(samples),
+                "avg_cost": sum(s[2] for s in samples) / len(samples),
+            }
+        return {"routes": result, "healthy": {tier: self.healthy(tier) for tier in self.tiers}}
+
+    def prometheus_lines(self):
+        """给Telemetry的/metrics追加路由指标"""
+        summary = self.summary()
+        lines = [
+            "# HELP pet_route_latency_seconds 各路由最近窗口内的延迟分位数",
+            "# TYPE pet_route_latency_seconds gauge",
+        ]
+        for name, s in summary["routes"].items():
+            lines.append(f'pet_route_latency_seconds{{route="{name}",quantile="0.5"}} {s["p50"]:.6f}')
+            lines.append(f'pet_route_latency_seconds{{route="{name}",quantile="0.95"}} {s["p95"]:.6f}')
+        lines.append("# HELP pet_route_tier_healthy 档位是否健康（0表示已降级）")
+        lines.append("# TYPE pet_route_tier_healthy gauge")
+        for tier, ok in sorted(summary["healthy"].items()):
+            lines.append(f'pet_route_tier_healthy{{tier="{tier}"}} {int(ok)}')
+        return lines
@@ -1,82 +1,279 @@
+import time
+SCRIPT_START = time.perf_counter()
 import streamlit as st
-from zhipuai import ZhipuAI
 import os
-import base64
-import tempfile
+import hashlib
 from dotenv import load_dotenv
-import sounddevice as sd
-import soundfile as sf
-import numpy as np
-from aip import AipSpeech
-import io
 import re
+import uuid
+# 录音/音频相关模块（sounddevice、numpy、aip、soundfile）在第一次用到语音功能时才导入
+from tts_pipeline import split_text_for_tts, synthesize_segments, SynthesisError, MAX_SEGMENT_LEN, VOICE_PERSONS
+from tts_cache import TTSCache, DEFAULT_CACHE_DIR, make_tts_key
+from image_preprocess import preprocess_image, data_url_bytes
+from history_manager import HistoryWindow, llm_summarizer, estimate_tokens
+from response_cache import ResponseCache, make_response_key
+from llm_client import get_llm_client
+from intent_engine import IntentEngine
+from telemetry import Telemetry, annotate, current_annotations
+from chat_store import ChatStore, DEFAULT_DB_PATH
+from scheduler import RequestScheduler, SchedulerCancelled
+from blob_store import BlobManager
+from model_router import ModelRouter
+from startup_profile import StartupProfile
+from faq_index import FAQIndex, format_passages
+from image_analysis import (ImageAnalysisCache, AnalysisPrefetcher, build_analysis_messages, parse_analysis,
+                            analysis_to_context, analysis_caption, needs_pixels)
+
+IMPORT_SECONDS = time.perf_counter() - SCRIPT_START
+
+@st.cache_resource
+def get_startup_profile():
+    """进程级启动/重跑耗时记录"""
+    return StartupProfile()
+
+startup_profile = get_startup_profile()
+
+@st.cache_resource
+def load_env():
+    """.env只在进程第一次执行脚本时读取"""
+    load_dotenv()
 
 # 加载环境变量
-load_dotenv()
-client = ZhipuAI(api_key=os.getenv("ZHIPU_API_KEY"))
+load_env()
+# 进程级共享客户端：连接复用、超时、重试和并发上限统一管理
+client = get_llm_client(api_key=os.getenv("ZHIPU_API_KEY"))
 
 # 百度语音配置
 BAIDU_APP_ID = os.getenv("BAIDU_APP_ID")
 BAIDU_API_KEY = os.getenv("BAIDU_API_KEY")
 BAIDU_SECRET_KEY = os.getenv("BAIDU_SECRET_KEY")
-baidu_client = AipSpeech(BAIDU_APP_ID, BAIDU_API_KEY, BAIDU_SECRET_KEY) if all([BAIDU_APP_ID, BAIDU_API_KEY, BAIDU_SECRET_KEY]) else None
-
-# 初始化会话状态（新增新图片上传标志）
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []  
-if "uploaded_image_base64" not in st.session_state:
-    st.session_state.uploaded_image_base64 = None
-if "tts_audio_segments" not in st.session_state:
-    st.session_state.tts_audio_segments = []
+# 图片预处理：最长边像素、JPEG质量
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+# 历史对话原文部分的token预算，超出部分折叠成摘要
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# 语音合成并发段数
+TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", "4"))
+BAIDU_CONFIGURED = all([BAIDU_APP_ID, BAIDU_API_KEY, BAIDU_SECRET_KEY])
+
+@st.cache_resource
+def get_baidu_client():
+    """进程级百度语音客户端，第一次用到语音识别/合成时才导入aip并创建"""
+    if not BAIDU_CONFIGURED:
+        return None
+    AipSpeech = startup_profile.lazy_import("aip").AipSpeech
+    return AipSpeech(BAIDU_APP_ID, BAIDU_API_KEY, BAIDU_SECRET_KEY)
+
+@st.cache_resource
+def get_tts_cache():
+    """进程级语音缓存，所有会话共享，rerun不会重建"""
+    return TTSCache(
+        cache_dir=os.getenv("TTS_CACHE_DIR", DEFAULT_CACHE_DIR),
+        max_disk_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "200")) * 1024 * 1024
+    )
+
+tts_cache = get_tts_cache()
+
+@st.cache_resource
+def get_response_cache():
+    """进程级问答缓存：同一张图+同样的问题直接返回，不再请求模型"""
+    return ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    )
+
+response_cache = get_response_cache()
+
+@st.cache_resource
+def get_telemetry():
+    """进程级耗时埋点：每轮写一行JSONL，可选写Prometheus文本文件或开/metrics端点"""
+    telemetry = Telemetry(
+        jsonl_path=os.getenv("TELEMETRY_JSONL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry_turns.jsonl")),
+        prom_path=os.getenv("METRICS_PROM_FILE") or None
+    )
+    if os.getenv("METRICS_PORT"):
+        telemetry.serve_prometheus(int(os.getenv("METRICS_PORT")))
+    return telemetry
+
+telemetry = get_telemetry()
+
+@st.cache_resource
+def get_chat_store():
+    """进程级对话库（SQLite），刷新页面后历史仍在"""
+    return ChatStore(os.getenv("CHAT_DB_PATH", DEFAULT_DB_PATH))
+
+chat_store = get_chat_store()
+
+def _env_rate(name, default):
+    """每秒请求数配置，0表示不限速"""
+    return float(os.getenv(name, default)) or None
+
+@st.cache_resource
+def get_scheduler():
+    """进程级请求调度：各服务商单独限并发和QPS，所有会话按轮转公平排队，相同在途请求合并"""
+    scheduler = RequestScheduler(queue_timeout=float(os.getenv("SCHED_QUEUE_TIMEOUT", "60")))
+    scheduler.configure("glm", int(os.getenv("SCHED_GLM_CONCURRENCY", "8")), _env_rate("SCHED_GLM_RPS", "0"))
+    scheduler.configure("baidu_tts", int(os.getenv("SCHED_TTS_CONCURRENCY", "4")), _env_rate("SCHED_TTS_RPS", "5"))
+    scheduler.configure("baidu_asr", int(os.getenv("SCHED_ASR_CONCURRENCY", "2")), _env_rate("SCHED_ASR_RPS", "5"))
+    telemetry.add_collector(scheduler.prometheus_lines)
+    return scheduler
+
+scheduler = get_scheduler()
+
+@st.cache_resource
+def get_image_analysis_cache():
+    """进程级照片分析缓存：按图片内容哈希，同一张图在所有会话里只做一次视觉分析"""
+    return ImageAnalysisCache(max_entries=int(os.getenv("IMAGE_ANALYSIS_CACHE_SIZE", "256")))
+
+image_analysis_cache = get_image_analysis_cache()
+# 上传新照片后立即在后台做分析，第一个问题到达时直接用结果或等待这一次
+ANALYSIS_PREFETCH = os.getenv("ANALYSIS_PREFETCH", "1") != "0"
+
+@st.cache_resource
+def get_analysis_prefetcher():
+    """进程级照片预分析线程池，同一张图在所有会话里只预取一次"""
+    return AnalysisPrefetcher(image_analysis_cache, max_workers=int(os.getenv("ANALYSIS_PREFETCH_WORKERS", "2")))
+
+analysis_prefetcher = get_analysis_prefetcher()
+
+@st.cache_resource
+def get_phash_index():
+    """
+    进程级照片感知哈希索引（持久化到磁盘）：近似重复的照片跨会话复用视觉分析；依赖缺失或关闭时返回None。
+    第一次上传照片时才创建，纯文字会话不导入numpy和索引模块。
+    """
+    if os.getenv("PHASH_ENABLED", "1") == "0":
+        return None
+    try:
+        phash_module = startup_profile.lazy_import("phash_index")
+    except ImportError as e:
+        print(f"感知哈希依赖缺失，不启用近似照片复用：{e}")
+        return None
+    return phash_module.PerceptualIndex(
+        path=os.getenv("PHASH_INDEX_PATH", phash_module.DEFAULT_INDEX_PATH),
+        max_entries=int(os.getenv("PHASH_INDEX_SIZE", "10000")),
+        save_delay=float(os.getenv("PHASH_SAVE_DELAY", "5"))
+    )
+
+@st.cache_resource
+def get_model_router():
+    """进程级模型路由：档位配置在model_routes.json，各路由的延迟/费用统计所有会话共享"""
+    router = ModelRouter.from_file()
+    telemetry.add_collector(router.prometheus_lines)
+    return router
+
+model_router = get_model_router()
+# 本地FAQ：置信度达到FAQ_ANSWER_THRESHOLD直接用库里的答案，达到FAQ_CONTEXT_THRESHOLD的作为参考资料
+FAQ_ANSWER_THRESHOLD = float(os.getenv("FAQ_ANSWER_THRESHOLD", "0.8"))
+FAQ_CONTEXT_THRESHOLD = float(os.getenv("FAQ_CONTEXT_THRESHOLD", "0.35"))
+# 问题里落在命中条目之外的内容太多（比如顺带描述了急症）时不直接作答，交给大模型
+FAQ_COVERAGE_THRESHOLD = float(os.getenv("FAQ_COVERAGE_THRESHOLD", "0.65"))
+
+@st.cache_resource
+def get_faq_index():
+    """进程级FAQ索引（mmap加载），索引缺失或faq.jsonl有改动时先重建；加载失败时不启用"""
+    if os.getenv("FAQ_ENABLED", "1") == "0":
+        return None
+    try:
+        return FAQIndex.from_file()
+    except (OSError, ValueError) as e:
+        print(f"FAQ索引加载失败，不启用本地问答：{e}")
+        return None
+
+faq_index = get_faq_index()
+
+@st.cache_resource
+def get_blob_manager():
+    """进程级图片等大对象存储：原始字节只存一份，超出内存上限的写到临时目录"""
+    return BlobManager(
+        memory_budget=int(os.getenv("BLOB_MEMORY_MB", "256")) * 1024 * 1024,
+        spill_dir=os.getenv("BLOB_SPILL_DIR") or None
+    )
+
+blob_manager = get_blob_manager()
+# 页面每次显示/加载更早时的消息条数
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "20"))
+
+# 会话ID放在URL参数sid里，刷新页面后仍能找回同一份历史
+if "session_id" not in st.session_state:
+    session_id = st.experimental_get_query_params().get("sid", [None])[0]
+    if not session_id:
+        session_id = uuid.uuid4().hex[:12]
+        st.experimental_set_query_params(sid=session_id)
+    st.session_state.session_id = session_id
+# 对话历史在chat_store里，这里只是按需查库的视图（消息里的音频也只存audio_id引用）
+chat_history = chat_store.history(st.session_state.session_id)
+# 本会话的大对象句柄，会话结束被回收时自动释放它存的图片
+if "session_blobs" not in st.session_state:
+    st.session_state.session_blobs = blob_manager.open_session()
+# 初始化会话状态（新增新图片上传标志）；当前图片只存blob_id，base64在发请求时才编码
+if "image_blob_id" not in st.session_state:
+    st.session_state.image_blob_id = None
 if "last_image_uploaded" not in st.session_state:
     st.session_state.last_image_uploaded = None
 # 新增：跟踪是否刚上传了新图片
 if "is_new_image_uploaded" not in st.session_state:
     st.session_state.is_new_image_uploaded = False
+# 历史窗口：摘要随会话增量更新
+if "history_window" not in st.session_state:
+    st.session_state.history_window = HistoryWindow(HISTORY_TOKEN_BUDGET, llm_summarizer(client))
+    st.session_state.history_window.summary, st.session_state.history_window.folded_count = chat_store.load_summary(st.session_state.session_id)
+# 页面上显示最近多少条消息，点“加载更早”时增加
+if "visible_messages" not in st.session_state:
+    st.session_state.visible_messages = CHAT_PAGE_SIZE
+# 流式输出：记录每轮的首字延迟（time-to-first-token）
+if "ttft_records" not in st.session_state:
+    st.session_state.ttft_records = []
+# 本次rerun里正在进行的一轮对话（没有提问时为None）
+current_turn = None
 
 # ------------------------------
 # 辅助函数：意图检测
 # ------------------------------
+@st.cache_resource
+def get_intent_engine():
+    """关键词表（intents.json）预编译成一个自动机，进程内只构建一次"""
+    return IntentEngine.from_file()
+
 def detect_intent(user_input):
     """检测用户输入的意图，判断是回溯历史还是当前图片提问"""
-    # 回溯历史的关键词（新增"上一个问题"等精准关键词）
-    history_keywords = ["之前", "刚才", "之前问的", "那只", "之前的", "之前说的", 
-                       "之前的问题", "上一个问题", "上一个", "刚才问的"]
-    # 当前图片的关键词
-    current_image_keywords = ["这只", "这是什么", "它", "这张", "当前", "现在"]
-    
-    # 检查是否包含回溯历史的关键词
-    if any(keyword in user_input for keyword in history_keywords):
-        return "history"
-    # 检查是否包含当前图片的关键词
-    elif any(keyword in user_input for keyword in current_image_keywords):
-        return "current_image"
-    else:
-        return "default"
+    return get_intent_engine().detect(user_input)
 
 # ------------------------------
 # 1. 本地录音功能
 # ------------------------------
-def record_audio_with_sounddevice(duration=5, samplerate=16000):
+def record_audio_with_sounddevice(duration=5, samplerate=16000, use_vad=False, silence_ms=800):
+    """录音并返回int16单声道数组；use_vad时说完话静音silence_ms后自动停止，duration作为最长时长"""
     try:
-        st.info(f"🎤 开始录音 {duration} 秒...请对着麦克风说话！")
-        audio_data = sd.rec(
-            int(duration * samplerate),
-            samplerate=samplerate,
-            channels=1,
-            dtype='int16'
-        )
-        sd.wait()
+        # sounddevice导入时会加载PortAudio并探测设备，只在真正录音时付这笔开销
+        sd = startup_profile.lazy_import("sounddevice")
+        vad_module = startup_profile.lazy_import("vad")
+        if use_vad:
+            st.info(f"🎤 开始录音（最长 {duration} 秒，说完自动停止）...请对着麦克风说话！")
+            vad = vad_module.EnergyVAD(samplerate=samplerate, silence_ms=silence_ms, max_duration=duration)
+            audio_data = vad_module.record_with_vad(
+                vad,
+                lambda sr, blocksize: sd.InputStream(samplerate=sr, channels=1, dtype='int16', blocksize=blocksize)
+            )
+            if not vad.has_speech:
+                st.warning("⚠️ 未检测到说话声，请靠近麦克风再试")
+                return None
+        else:
+            st.info(f"🎤 开始录音 {duration} 秒...请对着麦克风说话！")
+            audio_data = sd.rec(
+                int(duration * samplerate),
+                samplerate=samplerate,
+                channels=1,
+                dtype='int16'
+            )
+            sd.wait()
         
-        # 转为WAV字节流
-        wav_buffer = tempfile.SpooledTemporaryFile()
-        sf.write(wav_buffer, audio_data, samplerate, format='WAV')
-        wav_buffer.seek(0)
-        wav_bytes = wav_buffer.read()
-        wav_buffer.close()
+        # 直接返回录音缓冲区，不再编码成WAV再切掉文件头
+        audio_data = audio_data.reshape(-1)
+        annotate(audio_bytes=audio_data.nbytes, audio_seconds=round(len(audio_data) / samplerate, 3))
         
         st.success("✅ 录音完成！正在识别语音内容...")
-        return wav_bytes
+        return audio_data
     except Exception as e:
         st.error(f"❌ 录音失败：{str(e)}")
         return None
@@ -84,14 +281,18 @@ def record_audio_with_sounddevice(duration=5, samplerate=16000):
 # ------------------------------
 # 2. 百度语音识别（ASR）
 # ------------------------------
-def baidu_speech_to_text(wav_bytes):
+def baidu_speech_to_text(audio):
+    """audio为16kHz单声道int16数组，以memoryview零拷贝交给百度ASR"""
+    baidu_client = get_baidu_client()
     if not baidu_client:
         st.error("❌ 未配置百度语音参数，请检查.env文件")
         return ""
     
     try:
-        pcm_data = wav_bytes[44:] if len(wav_bytes) > 44 else wav_bytes
-        result = baidu_client.asr(pcm_data, 'pcm', 16000, {'dev_pid': 1537})
+        pcm_data = startup_profile.lazy_import("audio_io").pcm_view(audio)
+        annotate(audio_bytes=len(pcm_data))
+        result = scheduler.submit("baidu_asr", st.session_state.session_id,
+                                  lambda: baidu_client.asr(pcm_data, 'pcm', 16000, {'dev_pid': 1537}))
         
         if result.get("err_no") == 0 and "result" in result and len(result["result"]) > 0:
             return result["result"][0]
@@ -107,7 +308,9 @@ def baidu_speech_to_text(wav_bytes):
 # ------------------------------
 # 3. 百度语音合成（TTS）
 # ------------------------------
-def baidu_text_to_speech(text, per=0):
+def baidu_text_to_speech(text, per=0, on_segment=None):
+    """按句切分后并发合成，按顺序返回音频段；on_segment(idx, audio)可边合成边播放"""
+    baidu_client = get_baidu_client()
     if not baidu_client:
         st.error("❌ 未配置百度语音参数，无法播报语音")
         return None
@@ -121,116 +324,206 @@ def baidu_text_to_speech(text, per=0):
         st.warning("⚠️ 无有效文本可合成语音")
         return None
     
-    MAX_SEGMENT_LEN = 500
-    text_segments = [text[i:i+MAX_SEGMENT_LEN].strip() for i in range(0, len(text), MAX_SEGMENT_LEN) if text[i:i+MAX_SEGMENT_LEN].strip()]
+    text_segments = split_text_for_tts(text, MAX_SEGMENT_LEN)
+    annotate(text_chars=len(text), segments=len(text_segments))
     
-    try:
-        audio_segments = []
-        for idx, segment in enumerate(text_segments):
-            result = baidu_client.synthesis(
-                segment,
-                'zh',
-                1,
-                {
-                    'vol': 5,
-                    'per': per,
-                    'spd': 5,
-                    'pit': 5,
-                    'aue': 3
-                }
+    tts_options = {
+        'vol': 5,
+        'per': per,
+        'spd': 5,
+        'pit': 5,
+        'aue': 3
+    }
+    
+    # 合成在线程池里跑，拿不到session_state，先取出会话ID
+    session_id = st.session_state.session_id
+    
+    def synthesize(segment):
+        # 相同文本+相同发音参数直接命中缓存，不再请求百度；多个会话同时合成同一段时只请求一次
+        return tts_cache.get_or_synthesize(
+            segment,
+            tts_options,
+            lambda seg, options: scheduler.submit(
+                "baidu_tts", session_id,
+                lambda: baidu_client.synthesis(seg, 'zh', 1, options),
+                key=make_tts_key(seg, options)
             )
-            
-            if isinstance(result, dict):
-                st.error(f"❌ 第{idx+1}段合成失败：{result.get('err_msg', '未知错误')}")
-                return None
-            audio_segments.append(result)
-        
+        )
+    
+    try:
+        audio_segments = synthesize_segments(text_segments, synthesize, TTS_MAX_WORKERS, on_segment)
+        annotate(audio_bytes=sum(len(seg) for seg in audio_segments))
         st.success(f"✅ 语音合成完成（共{len(audio_segments)}段）")
         return audio_segments
+    except SynthesisError as e:
+        st.error(f"❌ 第{e.index+1}段合成失败：{e.err_msg}")
+        return None
     except Exception as e:
         st.error(f"❌ 语音合成出错：{str(e)}")
         return None
 
 # ------------------------------
-# 4. 前端音频合并播放
+# 4. 音频合并与按消息存储
 # ------------------------------
-def merge_audio_frontend(audio_segments):
+def _strip_id3(mp3_bytes):
+    """去掉MP3开头的ID3v2标签，保证多段拼接后仍是连续的MP3帧流"""
+    if len(mp3_bytes) < 10 or mp3_bytes[:3] != b"ID3":
+        return mp3_bytes
+    size = 0
+    for b in mp3_bytes[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    return mp3_bytes[10 + size:]
+
+def merge_audio_segments(audio_segments):
+    """把多段MP3合并成一个可直接播放的音频（MP3帧可直接首尾相接）"""
     if not audio_segments:
         return None
-    
-    segment_base64_list = [base64.b64encode(seg).decode('utf-8') for seg in audio_segments]
-    
-    js_code = f"""
-    <script>
-    let audioContext = null;
-    let source = null;
-    let mergedBuffer = null;
-    let isPlaying = false;
-    let startTime = 0;
-    let pauseTime = 0;
-
-    async function togglePlayback() {{
-        if (!audioContext) {{
-            audioContext = new (window.AudioContext || window.webkitAudioContext)();
-            const buffers = [];
-            for (const base64 of {segment_base64_list}) {{
-                const response = await fetch(`data:audio/mp3;base64,${{base64}}`);
-                const arrayBuffer = await response.arrayBuffer();
-                const audioBuffer = await audioContext.decodeAudioData(arrayBuffer);
-                buffers.push(audioBuffer);
-            }}
-            const totalLength = buffers.reduce((sum, buf) => sum + buf.length, 0);
-            mergedBuffer = audioContext.createBuffer(1, totalLength, buffers[0].sampleRate);
-            let offset = 0;
-            for (const buf of buffers) {{
-                mergedBuffer.getChannelData(0).set(buf.getChannelData(0), offset);
-                offset += buf.length;
-            }}
-        }}
-
-        if (isPlaying) {{
-            source.stop();
-            pauseTime = audioContext.currentTime - startTime;
-            isPlaying = false;
-            document.getElementById('mergePlayBtn').innerText = '▶️ 继续播放完整语音';
-        }} else {{
-            if (source && source.state === 'running') {{
-                source.stop();
-            }}
-            source = audioContext.createBufferSource();
-            source.buffer = mergedBuffer;
-            source.connect(audioContext.destination);
-            source.start(0, pauseTime);
-            startTime = audioContext.currentTime - pauseTime;
-            isPlaying = true;
-            document.getElementById('mergePlayBtn').innerText = '⏸️ 暂停播放';
-
-            source.onended = () => {{
-                isPlaying = false;
-                pauseTime = 0;
-                document.getElementById('mergePlayBtn').innerText = '🎧 播放合并后的完整语音';
-            }};
-        }}
-    }}
-    </script>
-    <button id="mergePlayBtn" onclick="togglePlayback()" style="padding: 8px 16px; background: #4CAF50; color: white; border: none; border-radius: 4px; cursor: pointer;">
-    🎧 播放合并后的完整语音
-    </button>
-    """
-    return js_code
+    return audio_segments[0] + b"".join(_strip_id3(seg) for seg in audio_segments[1:])
+
+def store_message_audio(merged):
+    """合并好的音频存入对话库，返回消息里引用用的audio_id"""
+    audio_id = hashlib.sha256(merged).hexdigest()[:16]
+    chat_store.put_audio(st.session_state.session_id, audio_id, merged)
+    return audio_id
+
+def save_history_summary():
+    """历史窗口折叠出新摘要后写回对话库，刷新页面不用重新摘要"""
+    window = st.session_state.history_window
+    chat_store.save_summary(st.session_state.session_id, window.summary, window.folded_count)
+
+def speak_reply(response, per):
+    """合成回复语音：合成中逐段播放，完成后换成一个合并好的播放器，返回audio_id"""
+    player_slot = st.empty()
+    segment_box = player_slot.container()
+
+    def play_tts_segment(idx, audio_bytes):
+        # 语音合成流水线回调：某段就绪后立即渲染播放器
+        segment_box.caption(f"🎧 语音播报 - 第{idx+1}段")
+        segment_box.audio(audio_bytes, format='audio/mp3', start_time=0)
+
+    # 每段合成好就先放出播放器，不必等全部段完成
+    tts_audio_segments = baidu_text_to_speech(response, per=per, on_segment=play_tts_segment)
+    merged = merge_audio_segments(tts_audio_segments)
+    if not merged:
+        return None
+    audio_id = store_message_audio(merged)
+    player_slot.audio(merged, format='audio/mp3')
+    return audio_id
 
 # ------------------------------
 # 5. 智谱AI对话
 # ------------------------------
-def pet_multimodal_chat(image_base64, user_input, chat_history, use_history=True):
+def estimate_prompt_tokens(messages):
+    return sum(estimate_tokens(msg["content"]) for msg in messages)
+
+def run_image_analysis(get_image_url, image_hash, session_id, cancel=None, perceptual=None):
+    """
+    调用一次视觉模型做结构化分析并写入缓存。不依赖Streamlit上下文，预取线程里也能调用；
+    get_image_url在拿到调度名额后才调用，排队期间被取消的请求不会编码图片。
+    perceptual为（pHash, dHash）时把结果登记进感知哈希索引，之后的近似照片直接复用。
+    """
+    response = scheduler.submit(
+        "glm", session_id,
+        lambda: client.chat.completions.create(model="glm-4v", messages=build_analysis_messages(get_image_url()), temperature=0.1),
+        key=("analysis", image_hash), cancel=cancel
+    )
+    analysis = parse_analysis(response.choices[0].message.content)
+    image_analysis_cache.put(image_hash, analysis)
+    # 有perceptual说明上传时已创建过索引，这里取到的是同一个实例
+    phash_index = get_phash_index() if perceptual else None
+    if phash_index is not None:
+        phash_index.add(image_hash, perceptual[0], perceptual[1], analysis)
+    return analysis
+
+def get_image_analysis(get_image_url, image_hash):
+    """取照片的结构化分析：缓存 → 等待在途的预取 → 调用一次视觉模型；失败返回None"""
+    analysis = image_analysis_cache.get(image_hash)
+    if analysis is not None:
+        return analysis
+    analysis = analysis_prefetcher.wait(image_hash)
+    if analysis is not None:
+        annotate(vision_analysis=True, analysis_prefetched=True)
+        return analysis
+    perceptual = (st.session_state.get("image_prepare_info") or {}).get("perceptual")
+    try:
+        try:
+            analysis = run_image_analysis(get_image_url, image_hash, st.session_state.session_id, perceptual=perceptual)
+        except SchedulerCancelled:
+            # 合并到了其他会话对同一张图的预取上，而那个会话刚换了图，自己重新发一次
+            analysis = run_image_analysis(get_image_url, image_hash, st.session_state.session_id, perceptual=perceptual)
+    except Exception as e:
+        st.warning(f"⚠️ 照片分析失败，本轮直接把图片发给视觉模型：{str(e)}")
+        return None
+    annotate(vision_analysis=True, analysis_prefetched=False)
+    return analysis
+
+def start_analysis_prefetch(image_hash, blob_id, perceptual=None):
+    """新照片一上传就开始后台分析；图片从本会话的blob里取，在真正发请求时才编码"""
+    session_blobs = st.session_state.session_blobs
+    session_id = st.session_state.session_id
+    analysis_prefetcher.start(
+        image_hash, session_blobs.owner,
+        lambda cancel: run_image_analysis(lambda: session_blobs.data_url(blob_id), image_hash, session_id, cancel, perceptual)
+    )
+
+def reuse_near_duplicate_analysis(prepared_image):
+    """
+    计算照片的感知哈希，已分析过的近似照片（缩放、重新压缩、截图）直接把它的分析记到这张图名下。
+    返回匹配记录（含两种哈希的距离），没有时返回None。
+    """
+    phash_index = get_phash_index()
+    if phash_index is None:
+        return None
+    try:
+        perceptual = startup_profile.lazy_import("phash_index").image_hashes(prepared_image["data"])
+    except Exception:
+        return None
+    st.session_state.image_prepare_info["perceptual"] = perceptual
+    if prepared_image["hash"] in image_analysis_cache:
+        return None
+    match = phash_index.find(*perceptual)
+    if match is None or not match["analysis"]:
+        return None
+    image_analysis_cache.put(prepared_image["hash"], match["analysis"])
+    return match
+
+def drop_current_image():
+    """换图或删图：取消这张图还在排队的预取，释放图片字节"""
+    prepared_image = st.session_state.get("image_prepare_info")
+    if prepared_image:
+        analysis_prefetcher.cancel(prepared_image["hash"], st.session_state.session_blobs.owner)
+    if st.session_state.image_blob_id:
+        st.session_state.session_blobs.release(st.session_state.image_blob_id)
+    st.session_state.image_blob_id = None
+    st.session_state.image_prepare_info = None
+
+def request_completion(cache_key, stream, **kwargs):
+    """经调度器发出对话请求：按会话公平排队，同一问题（含图片和上下文）的在途请求只发一次"""
+    session_id = st.session_state.session_id
+    if stream:
+        return scheduler.submit_stream("glm", session_id, lambda: client.chat.completions.create(stream=True, **kwargs), key=cache_key)
+    return scheduler.submit("glm", session_id, lambda: client.chat.completions.create(**kwargs), key=cache_key)
+
+def pet_multimodal_chat(image_base64, user_input, chat_history, use_history=True, stream=False, image_hash=None, model="glm-4v", references=None):
     messages = [
         {"role": "system", "content": "你是专业的宠物专家，精通动物品种和动物医疗方面知识，回答要简洁精准。如果用户提问涉及品种识别，请先识别品种，再回答问题；如果用户判断错误，要指出并解释。"}
     ]
+    if references:
+        messages[0]["content"] += f"\n\n可参考的养护知识（与问题相关时采用）：\n{references}"
     
-    # 根据use_history决定是否添加历史对话
+    # 根据use_history决定是否添加历史对话（预算内原文 + 更早轮次的摘要）
     if use_history:
-        for msg in chat_history:
-            messages.append({"role": msg["role"], "content": msg["content"]})
+        messages = st.session_state.history_window.to_messages(messages[0]["content"], chat_history)
+    
+    # 缓存键：规范化问题 + 图片内容哈希 + 模型 + 温度 + 上下文指纹
+    if image_hash is None:
+        image_hash = hashlib.sha256(image_base64.encode('utf-8')).hexdigest()
+    cache_key = make_response_key(user_input, model, 0.3, image_hash, messages)
+    annotate(model=model, image_bytes=data_url_bytes(image_base64), prompt_tokens=estimate_prompt_tokens(messages) + estimate_tokens(user_input))
+    cached = response_cache.get(cache_key)
+    annotate(cache_hit=cached is not None)
+    if cached is not None:
+        return iter([cached]) if stream else cached
     
     messages.append({
         "role": "user",
@@ -241,21 +534,34 @@ def pet_multimodal_chat(image_base64, user_input, chat_history, use_history=True
     })
     
     try:
-        response = client.chat.completions.create(
-            model="glm-4v",
+        response = request_completion(
+            cache_key,
+            stream,
+            model=model,
             messages=messages,
             temperature=0.3
         )
-        return response.choices[0].message.content
+        if stream:
+            return iter_stream_tokens(response, on_complete=lambda text: response_cache.put(cache_key, text))
+        reply = response.choices[0].message.content
+        response_cache.put(cache_key, reply)
+        return reply
     except Exception as e:
+        annotate(llm_error=True)
         st.error(f"❌ 多模态请求出错：{str(e)}")
         return "抱歉，暂时无法处理图片请求，请稍后再试。"
 
 # 【核心修改】新增exclude_last_user参数，排除当前提问，只传更早的历史
-def pet_text_chat(user_input, chat_history, use_history=True, exclude_last_user=False):
+def pet_text_chat(user_input, chat_history, use_history=True, exclude_last_user=False, stream=False, image_analysis=None, image_hash=None, model="glm-4", references=None):
     messages = [
         {"role": "system", "content": "你是专业的宠物养护助手，结合历史对话回答用户问题，回答要个性化、简洁实用。如果用户问上一个问题/之前的问题是什么，请准确引用历史对话内容回答。"}
     ]
+    # 用户上传过照片时，附上视觉模型对这张照片的分析，追问不必再发图片
+    if image_analysis:
+        messages[0]["content"] += f"\n\n用户当前照片的分析结果（来自视觉模型）：\n{analysis_to_context(image_analysis)}"
+    # 本地FAQ里相关但不足以直接作答的条目作为参考资料
+    if references:
+        messages[0]["content"] += f"\n\n可参考的养护知识（与问题相关时采用）：\n{references}"
     
     # 根据use_history决定是否添加历史对话
     if use_history:
@@ -265,22 +571,143 @@ def pet_text_chat(user_input, chat_history, use_history=True, exclude_last_user=
         else:
             history_to_use = chat_history
         
-        for msg in history_to_use:
-            messages.append({"role": msg["role"], "content": msg["content"]})
+        messages = st.session_state.history_window.to_messages(messages[0]["content"], history_to_use)
+    
+    cache_key = make_response_key(user_input, model, 0.3, image_hash, messages)
+    annotate(model=model, prompt_tokens=estimate_prompt_tokens(messages) + estimate_tokens(user_input))
+    cached = response_cache.get(cache_key)
+    annotate(cache_hit=cached is not None)
+    if cached is not None:
+        return iter([cached]) if stream else cached
     
     messages.append({"role": "user", "content": user_input})
     
     try:
-        response = client.chat.completions.create(
-            model="glm-4",
+        response = request_completion(
+            cache_key,
+            stream,
+            model=model,
             messages=messages,
             temperature=0.3
         )
-        return response.choices[0].message.content
+        if stream:
+            return iter_stream_tokens(response, on_complete=lambda text: response_cache.put(cache_key, text))
+        reply = response.choices[0].message.content
+        response_cache.put(cache_key, reply)
+        return reply
     except Exception as e:
+        annotate(llm_error=True)
         st.error(f"❌ 文本请求出错：{str(e)}")
         return "抱歉，暂时无法处理请求，请稍后再试。"
 
+# ------------------------------
+# 5.1 流式输出
+# ------------------------------
+def iter_stream_tokens(response, on_complete=None):
+    """从智谱流式响应中逐个取出文本增量；完整读完后把全文交给on_complete（如写缓存）"""
+    parts = []
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+    if on_complete and parts:
+        on_complete("".join(parts))
+
+def render_streaming_reply(reply, start_time):
+    """把回复逐token渲染到当前气泡，返回（完整文本, 首字延迟秒数）"""
+    placeholder = st.empty()
+    # 请求出错时pet_*_chat直接返回兜底文本
+    if isinstance(reply, str):
+        placeholder.markdown(reply)
+        return reply, None
+    
+    ttft = None
+    text = ""
+    try:
+        for token in reply:
+            if ttft is None:
+                ttft = time.perf_counter() - start_time
+            text += token
+            placeholder.markdown(text + "▌")
+    except Exception as e:
+        annotate(llm_error=True)
+        st.error(f"❌ 流式输出中断：{str(e)}")
+    if not text:
+        text = "抱歉，暂时无法处理请求，请稍后再试。"
+    placeholder.markdown(text)
+    return text, ttft
+
+def current_image_data_url():
+    """当前照片的data URL，每次用到时临时编码，不在会话里常驻"""
+    return st.session_state.session_blobs.data_url(st.session_state.image_blob_id)
+
+def generate_assistant_reply(user_prompt, intent, use_image, use_history, spinner_text):
+    """在当前助手气泡中生成回复（支持流式），返回完整回复文本"""
+    stream = st.session_state.get("use_stream", True)
+    start_time = time.perf_counter()
+    with st.spinner(spinner_text):
+        image_relevant = bool(use_image and st.session_state.image_blob_id)
+        image_hash = (st.session_state.get("image_prepare_info") or {}).get("hash") if image_relevant else None
+        # 每张图只做一次视觉分析；之后的问题用文本模型+分析结果回答，需要看细节时才重新发图
+        analysis = get_image_analysis(current_image_data_url, image_hash) if image_hash else None
+        # 常见养护问题先查本地FAQ：和照片无关且把握足够时直接作答，不调用大模型
+        faq_result = None
+        if faq_index and intent != "history":
+            faq_result = faq_index.lookup(user_prompt, FAQ_ANSWER_THRESHOLD, FAQ_CONTEXT_THRESHOLD,
+                                          coverage_threshold=FAQ_COVERAGE_THRESHOLD)
+            if faq_result["results"]:
+                annotate(faq_confidence=round(faq_result["results"][0]["confidence"], 3),
+                         faq_coverage=round(faq_result["results"][0]["coverage"], 3))
+        if faq_result and faq_result["answer"] and not image_relevant:
+            annotate(model="faq", faq_hit=faq_result["hit"]["id"])
+            reply = faq_result["answer"]
+            st.markdown(reply)
+            st.caption(f"📚 来自本地养护知识库：{faq_result['hit']['question']}")
+            st.session_state.ttft_records.append(time.perf_counter() - start_time)
+            annotate(reply_chars=len(reply))
+            return reply
+        references = format_passages(faq_index, faq_result["passages"]) if faq_result and faq_result["passages"] else None
+        route = model_router.route(user_prompt, estimate_tokens(user_prompt), image_relevant,
+                                   has_analysis=analysis is not None, needs_pixels=needs_pixels(user_prompt), intent=intent)
+        annotate(route=route["name"], route_reason=route["reason"])
+        llm_start = time.perf_counter()
+        if route["payload"] == "image":
+            reply = pet_multimodal_chat(current_image_data_url(), user_prompt, chat_history, use_history, stream=stream, image_hash=image_hash, model=route["model"], references=references)
+        elif route["payload"] == "analysis":
+            reply = pet_text_chat(user_prompt, chat_history, use_history, stream=stream, image_analysis=analysis, image_hash=image_hash, model=route["model"], references=references)
+        else:
+            # 【核心修改】回溯历史时，传入exclude_last_user=True，排除当前提问
+            exclude_last = True if intent == "history" else False
+            reply = pet_text_chat(user_prompt, chat_history, use_history, exclude_last, stream=stream, model=route["model"], references=references)
+    
+    if not stream:
+        st.markdown(reply)
+        # 非流式时首字延迟即完整生成耗时
+        st.session_state.ttft_records.append(time.perf_counter() - start_time)
+        annotate(reply_chars=len(reply))
+        observe_route(route, llm_start, reply)
+        return reply
+    
+    response, ttft = render_streaming_reply(reply, start_time)
+    if ttft is not None:
+        st.session_state.ttft_records.append(ttft)
+        annotate(ttft_seconds=round(ttft, 4))
+        st.caption(f"⚡ 首字延迟 {ttft:.2f} 秒 · 总耗时 {time.perf_counter() - start_time:.2f} 秒")
+    annotate(reply_chars=len(response))
+    observe_route(route, llm_start, response)
+    return response
+
+def observe_route(route, llm_start, reply):
+    """把本轮真实请求的耗时/token数/成败记到路由统计里；缓存命中的不算"""
+    notes = current_annotations()
+    if notes.get("cache_hit"):
+        return
+    tokens = notes.get("prompt_tokens", 0) + estimate_tokens(reply)
+    model_router.observe(route, time.perf_counter() - llm_start, tokens, ok=not notes.get("llm_error"))
+
 # ------------------------------
 # 6. 界面布局（核心：自动切换逻辑）
 # ------------------------------
@@ -289,7 +716,7 @@ st.title("🐾 宠物识别与养护助手 ")
 # 侧边栏
 with st.sidebar:
     # 百度语音状态
-    if baidu_client:
+    if BAIDU_CONFIGURED:
         st.success("✅ 已连接百度语音识别/合成服务")
     else:
         st.error("❌ 未配置百度语音参数")
@@ -305,17 +732,54 @@ with st.sidebar:
     
     # 检测新图片上传（核心：设置新图片标志）
     if uploaded_image:
-        image_identifier = f"{uploaded_image.name}_{uploaded_image.size}"
+        # 按内容哈希识别图片：改名的同一张图不算新图，同名同大小的不同照片也能区分
+        image_identifier = hashlib.sha256(uploaded_image.getvalue()).hexdigest()
+        upload_error = None
         if image_identifier != st.session_state.last_image_uploaded:
-            image_base64 = base64.b64encode(uploaded_image.getvalue()).decode("utf-8")
-            st.session_state.uploaded_image_base64 = f"data:image/jpeg;base64,{image_base64}"
+            # 摆正、缩放、重新编码并识别真实格式，减小每次视觉请求的体积
+            # 字节只交给BlobManager保存（受内存上限约束），不再在预处理缓存里多存一份
+            try:
+                prepared_image = preprocess_image(uploaded_image.getvalue(), IMAGE_MAX_EDGE, IMAGE_JPEG_QUALITY, cache=False)
+            except (OSError, ValueError) as e:  # PIL.UnidentifiedImageError是OSError的子类
+                upload_error = e
+        if upload_error is not None:
+            # 文件损坏或无法解码：提示用户，当前照片和它的分析保持不变
+            st.error(f"❌ 无法识别这张图片，请换一张：{upload_error}")
+        elif image_identifier != st.session_state.last_image_uploaded:
+            drop_current_image()
+            st.session_state.image_blob_id = st.session_state.session_blobs.put(prepared_image["data"], prepared_image["mime"])
+            st.session_state.image_prepare_info = {k: v for k, v in prepared_image.items() if k != "data"}
+            # 近似照片已有分析时直接复用，预取看到缓存里有结果就不会再发请求
+            near_duplicate = reuse_near_duplicate_analysis(prepared_image)
+            st.session_state.image_prepare_info["near_duplicate"] = near_duplicate and {
+                "phash_distance": near_duplicate["phash_distance"], "dhash_distance": near_duplicate["dhash_distance"]}
+            if ANALYSIS_PREFETCH:
+                start_analysis_prefetch(prepared_image["hash"], st.session_state.image_blob_id,
+                                        st.session_state.image_prepare_info.get("perceptual"))
             st.session_state.last_image_uploaded = image_identifier
             # 关键：标记为刚上传新图片
             st.session_state.is_new_image_uploaded = True
             st.success("✅ 新图片已上传！AI将仅参考当前照片回答，不使用历史对话")
-        st.image(uploaded_image, caption="当前上传的宠物照片", use_column_width=True)
+        if upload_error is None:
+            st.image(uploaded_image, caption="当前上传的宠物照片", use_column_width=True)
+        elif st.session_state.image_blob_id:
+            st.image(st.session_state.session_blobs.get(st.session_state.image_blob_id), caption="仍在使用之前的照片", use_column_width=True)
+        prepared_image = st.session_state.get("image_prepare_info")
+        if prepared_image:
+            st.caption(
+                f"图片预处理：{prepared_image['original_bytes'] / 1024:.0f} KB → {prepared_image['encoded_bytes'] / 1024:.0f} KB"
+                f"（{prepared_image['mime']}，{prepared_image['width']}×{prepared_image['height']}）"
+            )
+            cached_analysis = image_analysis_cache.get(prepared_image["hash"])
+            if cached_analysis:
+                st.caption(f"照片分析：{analysis_caption(cached_analysis)}")
+            elif analysis_prefetcher.pending(prepared_image["hash"]):
+                st.caption("照片分析：后台识别中…")
+            near_duplicate = prepared_image.get("near_duplicate")
+            if near_duplicate:
+                st.caption(f"♻️ 与之前分析过的照片近似（差异 {near_duplicate['phash_distance']}/{near_duplicate['dhash_distance']} 位），已直接复用分析结果")
     else:
-        st.session_state.uploaded_image_base64 = None
+        drop_current_image()
         st.session_state.last_image_uploaded = None
         st.info("请上传宠物照片以启用图片识别功能")
     
@@ -323,26 +787,107 @@ with st.sidebar:
     
     # 语音设置
     st.subheader("🎤 本地语音提问")
-    record_duration = st.number_input("录音时长（秒）", min_value=1, max_value=10, value=5, step=1, key="record_duration")
+    use_vad = st.checkbox("🔇 说完自动停止", value=True, key="use_vad", help="检测到说话结束后自动停止录音，录音时长作为最长时长")
+    record_duration = st.number_input("录音时长（秒）", min_value=1, max_value=10, value=5, step=1, key="record_duration", help="开启自动停止时为最长录音时长")
+    vad_silence_ms = st.slider("静音多久后停止（毫秒）", min_value=300, max_value=2000, value=800, step=100, key="vad_silence_ms", disabled=not use_vad)
     
     st.subheader("🔊 语音播报设置")
     voice_type = st.selectbox(
         "选择发音人",
-        options=["女声（默认）", "男声", "情感女声", "情感男声"],
+        options=list(VOICE_PERSONS),
         index=0,
         key="voice_type"
     )
-    per_map = {"女声（默认）":0, "男声":1, "情感女声":3, "情感男声":4}
-    selected_per = per_map[voice_type]
+    selected_per = VOICE_PERSONS[voice_type]
     
+    use_stream = st.checkbox("⚡ 流式输出回复", value=True, key="use_stream", help="边生成边显示，减少等待首字的时间")
+    if st.session_state.ttft_records:
+        st.caption(f"上一轮首字延迟：{st.session_state.ttft_records[-1]:.2f} 秒")
+    response_cache_stats = response_cache.summary()
+    st.caption(f"问答缓存：命中率 {response_cache_stats['hit_rate']:.0%}（命中 {response_cache_stats['hits']} / 未命中 {response_cache_stats['misses']}，共 {response_cache_stats['entries']} 条）")
+    tts_cache_stats = tts_cache.summary()
+    st.caption(
+        f"语音缓存：命中率 {tts_cache_stats['hit_rate']:.0%}"
+        f"（内存 {tts_cache_stats['memory_hits']} / 磁盘 {tts_cache_stats['disk_hits']} / 未命中 {tts_cache_stats['misses']}）"
+    )
+    provider_names = {"glm": "智谱", "baidu_tts": "语音合成", "baidu_asr": "语音识别"}
+    for provider, stats in scheduler.summary()["providers"].items():
+        st.caption(
+            f"{provider_names.get(provider, provider)}调度：执行 {stats['active']}/{stats['max_concurrency']} · 排队 {stats['queued']}"
+            f" · 等待p95 {stats['wait_p95']:.2f} 秒 · 合并 {stats['coalesced']} 次"
+        )
+    router_stats = model_router.summary()
+    for route_name, stats in router_stats["routes"].items():
+        st.caption(
+            f"路由 {route_name}：{stats['count']} 次 · p95 {stats['p95']:.2f} 秒"
+            f" · 错误率 {stats['error_rate']:.0%} · 平均费用 ¥{stats['avg_cost']:.4f}"
+        )
+    degraded_tiers = [tier for tier, ok in router_stats["healthy"].items() if not ok]
+    if degraded_tiers:
+        st.caption(f"⚠️ 已降级的模型档位：{'、'.join(degraded_tiers)}")
+    session_resident, session_spilled = st.session_state.session_blobs.memory()
+    blob_stats = blob_manager.summary()
+    st.caption(
+        f"本会话图片占用：内存 {session_resident / 1024:.0f} KB · 落盘 {session_spilled / 1024:.0f} KB"
+        f"（进程共 {blob_stats['resident_bytes'] / 1024 / 1024:.1f}/{blob_stats['memory_budget'] / 1024 / 1024:.0f} MB，"
+        f"{blob_stats['blobs']} 个对象，{blob_stats['spilled_blobs']} 个已落盘）"
+    )
+
+    # 最近几轮的分阶段耗时（本轮结束后下一次刷新时出现）
+    with st.expander("⏱️ 每轮耗时分解", expanded=False):
+        panel_turns = int(os.getenv("TELEMETRY_PANEL_TURNS", "10"))
+        recent_turns = telemetry.recent_turns(st.session_state.session_id, panel_turns)
+        if recent_turns:
+            rows = []
+            for turn in reversed(recent_turns):
+                row = {"类型": turn["kind"], "总计(秒)": turn["total_seconds"]}
+                for span in turn["spans"]:
+                    row[span["stage"]] = round(row.get(span["stage"], 0.0) + span["seconds"], 3)
+                rows.append(row)
+            st.dataframe(rows, use_container_width=True)
+            for stage, stats in telemetry.stage_percentiles(st.session_state.session_id, panel_turns).items():
+                st.caption(f"{stage}：p50 {stats['p50']:.2f} 秒 · p95 {stats['p95']:.2f} 秒（{stats['count']} 轮）")
+        else:
+            st.caption("还没有完成的对话轮次")
+
+    # 进程首次执行和之后每次rerun的耗时，以及延迟导入的模块第一次用到时花的时间
+    with st.expander("🚀 启动/重跑耗时", expanded=False):
+        startup_stats = startup_profile.summary()
+        if startup_stats["first_run"]:
+            st.caption(f"首次执行：{startup_stats['first_run']['total']:.2f} 秒（其中导入 {startup_stats['first_run']['imports']:.2f} 秒）")
+        if startup_stats["reruns"]:
+            st.caption(f"重跑：p50 {startup_stats['rerun_p50'] * 1000:.0f} ms · p95 {startup_stats['rerun_p95'] * 1000:.0f} ms（{startup_stats['reruns']} 次）")
+        if startup_stats["lazy_loads"]:
+            for module_name, seconds in startup_stats["lazy_loads"].items():
+                st.caption(f"按需加载 {module_name}：{seconds * 1000:.0f} ms")
+        else:
+            st.caption("语音、照片相关模块尚未加载，纯文字会话不承担这部分开销")
+
     # 录音按钮
-    if st.button("▶️ 开始录音并识别", type="primary", key="record_btn"):
-        wav_bytes = record_audio_with_sounddevice(duration=record_duration)
-        if not wav_bytes:
+    record_clicked = st.button("▶️ 开始录音并识别", type="primary", key="record_btn")
+    # 也可以上传已录好的音频，自动转成16kHz单声道后识别
+    uploaded_audio = st.file_uploader("或上传录音文件（wav/flac/ogg）", type=["wav", "flac", "ogg"], key="audio_uploader")
+    recognize_file_clicked = st.button("📂 识别上传的录音", key="recognize_file_btn", disabled=uploaded_audio is None)
+    if record_clicked or recognize_file_clicked:
+        current_turn = telemetry.start_turn(st.session_state.session_id, "voice")
+        with current_turn.span("record"):
+            if recognize_file_clicked:
+                try:
+                    audio = startup_profile.lazy_import("audio_io").load_audio(uploaded_audio)
+                    annotate(audio_bytes=audio.nbytes, audio_seconds=round(len(audio) / 16000, 3), source="file")
+                except Exception as e:
+                    st.error(f"❌ 无法读取录音文件：{str(e)}")
+                    audio = None
+            else:
+                audio = record_audio_with_sounddevice(duration=record_duration, use_vad=use_vad, silence_ms=vad_silence_ms)
+        if audio is None or len(audio) == 0:
+            current_turn.finish()
             st.stop()
         
-        recognized_text = baidu_speech_to_text(wav_bytes)
+        with current_turn.span("asr"):
+            recognized_text = baidu_speech_to_text(audio)
         if not recognized_text:
+            current_turn.finish()
             st.stop()
         
         st.success(f"✅ 语音识别结果：{recognized_text}")
@@ -351,7 +896,7 @@ with st.sidebar:
         # 添加用户语音输入到对话历史
         with st.chat_message("user"):
             st.markdown(f"🎤 语音输入：{user_prompt}")
-        st.session_state.chat_history.append({"role": "user", "content": user_prompt})
+        chat_store.append(st.session_state.session_id, "user", user_prompt)
         
         # 自动判断模式
         intent = detect_intent(user_prompt)
@@ -371,33 +916,21 @@ with st.sidebar:
             use_history = True
         else:
             # 默认模式
-            use_image = True if st.session_state.uploaded_image_base64 else False
+            use_image = True if st.session_state.image_blob_id else False
             use_history = True
         
         # 生成AI回复
         with st.chat_message("assistant"):
-            with st.spinner("🤔 正在生成回复..."):
-                if use_image and st.session_state.uploaded_image_base64:
-                    response = pet_multimodal_chat(st.session_state.uploaded_image_base64, user_prompt, st.session_state.chat_history, use_history)
-                else:
-                    # 【核心修改】回溯历史时，排除当前提问
-                    exclude_last = True if intent == "history" else False
-                    response = pet_text_chat(user_prompt, st.session_state.chat_history, use_history, exclude_last)
-            st.markdown(response)
+            with current_turn.span("llm", intent=intent, use_image=use_image, use_history=use_history):
+                response = generate_assistant_reply(user_prompt, intent, use_image, use_history, "🤔 正在生成回复...")
             
             # 语音合成
-            tts_audio_segments = baidu_text_to_speech(response, per=selected_per)
-            if tts_audio_segments:
-                st.session_state.tts_audio_segments = tts_audio_segments
-                merge_js = merge_audio_frontend(st.session_state.tts_audio_segments)
-                if merge_js:
-                    st.components.v1.html(merge_js, height=50)
-                for idx, audio_bytes in enumerate(st.session_state.tts_audio_segments):
-                    st.caption(f"🎧 语音播报 - 第{idx+1}段")
-                    st.audio(audio_bytes, format='audio/mp3', start_time=0)
+            with current_turn.span("tts"):
+                audio_id = speak_reply(response, selected_per)
         
-        # 添加AI回复到对话历史
-        st.session_state.chat_history.append({"role": "assistant", "content": response})
+        # 添加AI回复到对话历史（音频只存引用）
+        chat_store.append(st.session_state.session_id, "assistant", response, audio_id)
+        save_history_summary()
     
     st.divider()
     
@@ -408,32 +941,42 @@ with st.sidebar:
         st.stop()
     
     if st.button("🗑️ 清空对话历史", key="clear_chat"):
-        st.session_state.chat_history = []
-        st.session_state.tts_audio_segments = []
+        chat_store.clear(st.session_state.session_id)
+        st.session_state.history_window.reset()
+        st.session_state.visible_messages = CHAT_PAGE_SIZE
         st.rerun()
 
 # ------------------------------
 # 聊天界面
 # ------------------------------
-for msg in st.session_state.chat_history:
+render_start = time.perf_counter()
+# 只渲染最近一页，更早的消息点按钮再加载
+total_messages = len(chat_history)
+if total_messages > st.session_state.visible_messages:
+    if st.button(f"⬆️ 加载更早的消息（还有 {total_messages - st.session_state.visible_messages} 条）", key="load_older"):
+        st.session_state.visible_messages += CHAT_PAGE_SIZE
+        st.rerun()
+visible_history = chat_store.recent(st.session_state.session_id, st.session_state.visible_messages)
+for msg in visible_history:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
-        # 修复：使用全局状态的tts_audio_segments，而非局部变量
-        if msg["role"] == "assistant" and st.session_state.tts_audio_segments:
-            merge_js = merge_audio_frontend(st.session_state.tts_audio_segments)
-            if merge_js:
-                st.components.v1.html(merge_js, height=50)
-            for seg_idx, audio_bytes in enumerate(st.session_state.tts_audio_segments):
-                st.caption(f"🎧 语音播报 - 第{seg_idx+1}段")
+        # 每条消息只渲染自己那一个合并好的音频，不再重复编码
+        audio_id = msg.get("audio_id")
+        if msg["role"] == "assistant" and audio_id:
+            audio_bytes = chat_store.get_audio(st.session_state.session_id, audio_id)
+            if audio_bytes:
                 st.audio(audio_bytes, format='audio/mp3')
+render_seconds = time.perf_counter() - render_start
+rendered_messages = len(visible_history)
 
 # 文字输入框
 user_prompt = st.chat_input("输入你的问题（如：它一直挠耳朵怎么办？）", key="chat_input")
 if user_prompt:
+    current_turn = telemetry.start_turn(st.session_state.session_id, "text")
     # 添加文字输入到对话历史
     with st.chat_message("user"):
         st.markdown(user_prompt)
-    st.session_state.chat_history.append({"role": "user", "content": user_prompt})
+    chat_store.append(st.session_state.session_id, "user", user_prompt)
     
     # 自动判断模式
     intent = detect_intent(user_prompt)
@@ -453,31 +996,25 @@ if user_prompt:
         use_history = True
     else:
         # 默认模式
-        use_image = True if st.session_state.uploaded_image_base64 else False
+        use_image = True if st.session_state.image_blob_id else False
         use_history = True
     
     # 生成AI回复
     with st.chat_message("assistant"):
-        with st.spinner("正在思考回复..."):
-            if use_image and st.session_state.uploaded_image_base64:
-                response = pet_multimodal_chat(st.session_state.uploaded_image_base64, user_prompt, st.session_state.chat_history, use_history)
-            else:
-                # 【核心修改】回溯历史时，传入exclude_last_user=True，排除当前提问
-                exclude_last = True if intent == "history" else False
-                response = pet_text_chat(user_prompt, st.session_state.chat_history, use_history, exclude_last)
-        st.markdown(response)
+        with current_turn.span("llm", intent=intent, use_image=use_image, use_history=use_history):
+            response = generate_assistant_reply(user_prompt, intent, use_image, use_history, "正在思考回复...")
         
         # 语音合成
-        selected_per = per_map.get(st.session_state.get("voice_type", "女声（默认）"), 0)
-        tts_audio_segments = baidu_text_to_speech(response, per=selected_per)
-        if tts_audio_segments:
-            st.session_state.tts_audio_segments = tts_audio_segments
-            merge_js = merge_audio_frontend(st.session_state.tts_audio_segments)
-            if merge_js:
-                st.components.v1.html(merge_js, height=50)
-            for idx, audio_bytes in enumerate(st.session_state.tts_audio_segments):
-                st.caption(f"🎧 语音播报 - 第{idx+1}段")
-                st.audio(audio_bytes, format='audio/mp3', start_time=0)
+        selected_per = VOICE_PERSONS.get(st.session_state.get("voice_type", "女声（默认）"), 0)
+        with current_turn.span("tts"):
+            audio_id = speak_reply(response, selected_per)
     
-    # 添加AI回复到对话历史
-    st.session_state.chat_history.append({"role": "assistant", "content": response})
\ No newline at end of file
+    # 添加AI回复到对话历史（音频只存引用）
+    chat_store.append(st.session_state.session_id, "assistant", response, audio_id)
+    save_history_summary()
+
+# 本轮结束：补记历史消息的渲染耗时并落盘（文字提问时渲染发生在本轮开始之前）
+if current_turn is not None:
+    current_turn.record("render", render_seconds, started=render_start, messages=rendered_messages)
+    current_turn.finish()
+startup_profile.record_run(IMPORT_SECONDS, time.perf_counter() - SCRIPT_START)
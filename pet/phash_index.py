@@ -0,0 +1,191 @@
+"""
+跨会话的照片感知哈希索引：缩放、重新压缩、截图后的同一张照片也能认出来，直接复用已有的视觉分析。
+- pHash（32×32灰度图做二维DCT，取低频8×8与中位数比较）+ dHash（9×8灰度图相邻像素比较），各64位
+- 哈希计算用NumPy批量完成；查找时把查询哈希与全部已存哈希一次性异或、数1的个数得到汉明距离
+- 两种哈希的距离都不超过阈值才算近似重复，减少误判
+- 持久化为一个npz文件（哈希数组 + 每条记录的图片内容哈希和分析结果JSON），进程重启后仍可复用；
+  新增记录后延迟save_delay秒合并写一次，进程退出时再写一次
+"""
+import atexit
+import io
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageOps
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "phash_index.npz")
+# 默认阈值按bench/bench_phash.py的距离分布取：同一张图的缩放/重压缩/截图变体最大约12/14，不同照片最小约22/22
+DEFAULT_PHASH_DISTANCE = 14
+DEFAULT_DHASH_DISTANCE = 16
+
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _to_gray(image):
+    """摆正方向；带透明通道的先铺白底，避免透明区域变黑影响哈希"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, rgba)
+    return image.convert("L")
+
+
+def _pack_bits(bits):
+    """(B, 64)布尔数组 -> (B,) uint64"""
+    return np.packbits(bits, axis=1).view('>u8').astype(np.uint64).reshape(-1)
+
+
+def perceptual_hashes(images):
+    """一批PIL图片 -> （pHash数组, dHash数组），均为uint64，DCT和比较对整批一次完成"""
+    grays = [_to_gray(image) for image in images]
+    big = np.stack([np.asarray(g.resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64) for g in grays])
+    small = np.stack([np.asarray(g.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.LANCZOS), dtype=np.int16) for g in grays])
+
+    # 二维DCT：C · X · Cᵀ，对整批做矩阵乘
+    low = (_DCT @ big @ _DCT.T)[:, :_HASH_SIZE, :_HASH_SIZE].reshape(len(grays), -1)
+    # 直流分量只反映整体亮度，不参与中位数
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    phash = _pack_bits(low > median)
+    dhash = _pack_bits((small[:, :, 1:] > small[:, :, :-1]).reshape(len(grays), -1))
+    return phash, dhash
+
+
+def image_hashes(data):
+    """图片字节 -> （pHash, dHash）两个Python int"""
+    phash, dhash = perceptual_hashes([Image.open(io.BytesIO(data))])
+    return int(phash[0]), int(dhash[0])
+
+
+def hamming(stored, query):
+    """stored为uint64数组，query为单个哈希；返回每条的汉明距离"""
+    xor = np.bitwise_xor(stored, np.uint64(query))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class PerceptualIndex:
+    """进程级共享，线程安全；超过max_entries时丢弃最早的记录"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, max_entries=10000,
+                 phash_distance=DEFAULT_PHASH_DISTANCE, dhash_distance=DEFAULT_DHASH_DISTANCE, save_delay=5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.phash_distance = phash_distance
+        self.dhash_distance = dhash_distance
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        # 写文件单独一把锁，保证快照按顺序落盘；generation每次修改加1，已落盘的版本不重复写、旧快照不会覆盖新的
+        self._save_lock = threading.Lock()
+        self._generation = 0
+        self._saved_generation = 0
+        self._save_timer = None
+        self._phash = np.zeros(0, dtype=np.uint64)
+        self._dhash = np.zeros(0, dtype=np.uint64)
+        # 与哈希数组一一对应：{"image_hash", "analysis"}；增删时整体替换，查找时不用加锁复制
+        self._records = []
+        self.stats = {"lookups": 0, "hits": 0}
+        if path and os.path.exists(path):
+            self._load()
+        if path:
+            atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                phash, dhash = data["phash"], data["dhash"]
+                records = json.loads(str(data["records"]))
+        except (OSError, ValueError, KeyError):
+            return
+        if len(phash) == len(dhash) == len(records):
+            self._phash, self._dhash, self._records = phash.astype(np.uint64), dhash.astype(np.uint64), records
+
+    def save(self):
+        """把当前内容写入path；自上次写入后没有修改时什么都不做"""
+        with self._save_lock:
+            with self._lock:
+                generation = self._generation
+                if generation == self._saved_generation:
+                    return
+                phash, dhash = self._phash, self._dhash
+                records = json.dumps(self._records, ensure_ascii=False)
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(tmp_path, phash=phash, dhash=dhash, records=np.array(records))
+            os.replace(tmp_path, self.path)
+            with self._lock:
+                self._saved_generation = generation
+
+    def _schedule_save(self):
+        """持锁调用：save_delay秒内的多次新增合并成一次写入"""
+        if self.save_delay <= 0 or self._save_timer is not None:
+            return
+        self._save_timer = threading.Timer(self.save_delay, self._delayed_save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _delayed_save(self):
+        with self._lock:
+            self._save_timer = None
+        self.save()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+    def add(self, image_hash, phash, dhash, analysis, persist=True):
+        """登记一张已分析过的照片；同一张图（内容哈希相同）只保留最新的分析"""
+        with self._lock:
+            for record in self._records:
+                if record["image_hash"] == image_hash:
+                    record["analysis"] = analysis
+                    break
+            else:
+                overflow = max(0, len(self._records) + 1 - self.max_entries)
+                self._phash = np.append(self._phash[overflow:], np.uint64(phash))
+                self._dhash = np.append(self._dhash[overflow:], np.uint64(dhash))
+                self._records = self._records[overflow:] + [{"image_hash": image_hash, "analysis": analysis}]
+            self._generation += 1
+            if persist and self.path:
+                self._schedule_save()
+        if persist and self.path and self.save_delay <= 0:
+            self.save()
+
+    def find(self, phash, dhash):
+        """
+        返回最相近的近似重复记录 {"image_hash", "analysis", "phash_distance", "dhash_distance"}，没有时返回None。
+        对全部已存哈希一次性计算距离。
+        """
+        with self._lock:
+            # add()只会整体替换数组和列表，这里拿到的引用在锁外也不会变
+            stored_phash, stored_dhash, records = self._phash, self._dhash, self._records
+            self.stats["lookups"] += 1
+        if len(records) == 0:
+            return None
+        phash_dist = hamming(stored_phash, phash)
+        dhash_dist = hamming(stored_dhash, dhash)
+        candidates = np.flatnonzero((phash_dist <= self.phash_distance) & (dhash_dist <= self.dhash_distance))
+        if len(candidates) == 0:
+            return None
+        best = candidates[np.argmin(phash_dist[candidates] + dhash_dist[candidates])]
+        with self._lock:
+            self.stats["hits"] += 1
+        return dict(records[best], phash_distance=int(phash_dist[best]), dhash_distance=int(dhash_dist[best]))
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._records))
@@ -0,0 +1,80 @@
+"""宠物问答回复缓存：按（规范化问题, 图片内容哈希, 模型, 温度, 历史指纹）命中，带TTL和LRU容量上限"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 规范化时去掉的标点和语气词尾
+_PUNCT = re.compile(r'[\s,.!?;:，。！？；：、~～…"\'“”‘’（）()【】\[\]]+')
+_TRAILING_PARTICLES = re.compile(r'[呢吗呀啊吧哦]+$')
+
+
+def normalize_question(question):
+    """全角转半角、去空白标点和句尾语气词、英文小写，让“这是什么品种？”和“这是什么品种呀”命中同一条"""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = _PUNCT.sub("", text)
+    return _TRAILING_PARTICLES.sub("", text)
+
+
+def history_fingerprint(messages):
+    """对实际发给模型的上下文（系统提示+摘要+历史）做指纹，上下文不同就不会串答案"""
+    payload = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def make_response_key(question, model, temperature, image_hash=None, context_messages=()):
+    context_messages = list(context_messages)
+    # 历史末尾就是当前问题时不计入指纹，问题已按规范化形式进了键
+    if context_messages and context_messages[-1] == {"role": "user", "content": question}:
+        context_messages = context_messages[:-1]
+    payload = json.dumps(
+        [normalize_question(question), image_hash or "", model, temperature, history_fingerprint(context_messages)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """进程内LRU + TTL缓存，线程安全，所有会话共享"""
+
+    def __init__(self, max_entries=512, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (写入时间, 回复文本)
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            stored_at, text = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = (time.time(), text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def hit_rate(self):
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), hit_rate=self.hit_rate())
@@ -0,0 +1,320 @@
+"""
+跨会话的外部请求调度器（进程级，所有Streamlit会话共用）：
+- 每个服务商（智谱、百度合成、百度识别）单独限制并发数和每秒请求数
+- 排队按会话轮转，一个会话连发很多请求也不会饿死其他会话
+- 相同的在途请求（同一段TTS文本、同一张图+同一个问题）只发一次上游，结果共享；流式结果也能共享
+- 统计排队深度、等待时间和合并次数
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait
+
+from llm_client import RateLimiter
+from telemetry import percentile
+
+CANCEL_POLL_SECONDS = 0.1
+
+
+class SchedulerTimeout(TimeoutError):
+    """排队超过等待上限仍没轮到"""
+
+
+class SchedulerCancelled(Exception):
+    """排队期间被调用方取消（例如预取的照片已被新照片替换）"""
+
+
+class _Provider:
+    """某个服务商的并发名额 + 令牌桶 + 按会话轮转的等待队列"""
+
+    def __init__(self, name, max_concurrency, rate=None, burst=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.limiter = RateLimiter(rate, burst) if rate else None
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queues = OrderedDict()  # session_id -> deque[ticket]，队首会话先放行
+        self.waits = deque(maxlen=1000)
+        self.stats = {"submitted": 0, "coalesced": 0, "timeouts": 0, "cancelled": 0, "errors": 0}
+
+    def _head(self):
+        for queue in self._queues.values():
+            return queue[0]
+        return None
+
+    def _remove(self, session_id, ticket):
+        queue = self._queues[session_id]
+        queue.remove(ticket)
+        if queue:
+            # 这个会话还有请求在排，挪到队尾，轮到其他会话
+            self._queues.move_to_end(session_id)
+        else:
+            del self._queues[session_id]
+
+    def acquire(self, session_id, timeout=None, cancel=None):
+        """
+        排队拿一个并发名额，再按速率限制等令牌；返回排队等待的秒数。
+        cancel是threading.Event，排队期间被set则放弃排队；已拿到名额的请求不受影响。
+        """
+        ticket = object()
+        start = time.monotonic()
+        end_time = start + timeout if timeout is not None else None
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            while not (self._active < self.max_concurrency and self._head() is ticket):
+                remaining = None if end_time is None else end_time - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._remove(session_id, ticket)
+                    self.stats["timeouts"] += 1
+                    self._cond.notify_all()
+                    raise SchedulerTimeout(f"{self.name} 排队超过 {timeout:.1f} 秒")
+                if cancel is not None:
+                    if cancel.is_set():
+                        self._remove(session_id, ticket)
+                        self.stats["cancelled"] += 1
+                        self._cond.notify_all()
+                        raise SchedulerCancelled(f"{self.name} 请求已取消")
+                    # 取消信号不会唤醒条件变量，定期醒来检查
+                    remaining = CANCEL_POLL_SECONDS if remaining is None else min(remaining, CANCEL_POLL_SECONDS)
+                self._cond.wait(remaining)
+            self._remove(session_id, ticket)
+            self._active += 1
+            # 还有空闲名额时让下一个会话的队首也继续
+            self._cond.notify_all()
+        if self.limiter:
+            self.limiter.acquire()
+        waited = time.monotonic() - start
+        self.waits.append(waited)
+        return waited
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def count(self, name):
+        with self._cond:
+            self.stats[name] += 1
+
+    def summary(self):
+        with self._cond:
+            queued = sum(len(q) for q in self._queues.values())
+            waiting_sessions = len(self._queues)
+            active = self._active
+        waits = list(self.waits)
+        return dict(self.stats, active=active, queued=queued, waiting_sessions=waiting_sessions,
+                    max_concurrency=self.max_concurrency,
+                    wait_p50=percentile(waits, 50) or 0.0, wait_p95=percentile(waits, 95) or 0.0)
+
+
+class _SharedStream:
+    """一次上游流式响应的缓冲区：后台线程读上游，任意多个消费者各自从头读"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._items = []
+        self._done = False
+        self._error = None
+
+    def pump(self, iterator):
+        try:
+            for item in iterator:
+                with self._cond:
+                    self._items.append(item)
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def fail(self, exc):
+        with self._cond:
+            self._error = exc
+            self._done = True
+            self._cond.notify_all()
+
+    def reader(self):
+        idx = 0
+        while True:
+            with self._cond:
+                while idx >= len(self._items) and not self._done:
+                    self._cond.wait()
+                if idx < len(self._items):
+                    item = self._items[idx]
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            idx += 1
+            yield item
+
+
+class RequestScheduler:
+    """
+    用法：
+      scheduler.configure("glm", max_concurrency=4, rate=2)
+      reply = scheduler.submit("glm", session_id, lambda: client.chat.completions.create(...), key=cache_key)
+      tokens = scheduler.submit_stream("glm", session_id, lambda: client.chat.completions.create(..., stream=True), key=cache_key)
+    key相同的在途请求只执行一次；key为None时不合并。
+    合并到在途请求上的调用最多等timeout秒（默认queue_timeout + call_timeout，即领头请求排队加执行的上限）。
+    """
+
+    def __init__(self, queue_timeout=60.0, call_timeout=120.0):
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self._providers = {}
+        self._inflight = {}  # (provider, key) -> Future；(provider, key, "stream") -> _SharedStream
+        self._lock = threading.Lock()
+
+    def configure(self, provider, max_concurrency, rate=None, burst=None):
+        with self._lock:
+            if provider not in self._providers:
+                self._providers[provider] = _Provider(provider, max_concurrency, rate, burst)
+            return self._providers[provider]
+
+    def _provider(self, name):
+        with self._lock:
+            provider = self._providers.get(name)
+        if provider is None:
+            raise KeyError(f"未配置的服务商：{name}")
+        return provider
+
+    def submit(self, provider_name, session_id, fn, key=None, cancel=None, timeout=None):
+        """
+        排队执行fn()并返回结果；同key的在途请求直接等待并共享同一个结果；cancel见_Provider.acquire。
+        timeout为调用方愿意等待的总秒数：排队最多等min(queue_timeout, timeout)，合并等待最多等timeout。
+        """
+        provider = self._provider(provider_name)
+        end_time = time.monotonic() + (timeout if timeout is not None else self.queue_timeout + self.call_timeout)
+        inflight_key = (provider_name, key)
+        if key is not None:
+            with self._lock:
+                shared = self._inflight.get(inflight_key)
+                if shared is None:
+                    future = Future()
+                    self._inflight[inflight_key] = future
+            if shared is not None:
+                provider.count("coalesced")
+                return self._wait_shared(provider, shared, end_time, cancel)
+
+        provider.count("submitted")
+        queue_timeout = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+        try:
+            provider.acquire(session_id, queue_timeout, cancel)
+            try:
+                result = fn()
+            finally:
+                provider.release()
+        except Exception as e:
+            provider.count("errors")
+            if key is not None:
+                self._finish(inflight_key)
+                future.set_exception(e)
+            raise
+        if key is not None:
+            self._finish(inflight_key)
+            future.set_result(result)
+        return result
+
+    def _wait_shared(self, provider, shared, end_time, cancel=None):
+        """等待合并到的在途请求，超过end_time抛SchedulerTimeout；cancel被set时抛SchedulerCancelled"""
+        while True:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                provider.count("timeouts")
+                raise SchedulerTimeout(f"{provider.name} 等待合并的在途请求超时")
+            if cancel is not None:
+                if cancel.is_set():
+                    provider.count("cancelled")
+                    raise SchedulerCancelled(f"{provider.name} 请求已取消")
+                remaining = min(remaining, CANCEL_POLL_SECONDS)
+            # 不用result(timeout)区分超时：3.11起它抛的就是内置TimeoutError，领头请求自己的超时异常会被误认
+            wait([shared], timeout=remaining)
+            if shared.done():
+                return shared.result()
+
+    def submit_stream(self, provider_name, session_id, fn, key=None):
+        """
+        流式版本：fn()返回上游迭代器。上游由后台线程读完并缓冲，名额一直占到读完为止；
+        同key的请求拿到同一个缓冲区的独立读取器，从第一个token开始读。
+        """
+        provider = self._provider(provider_name)
+        # 流式和非流式的结果形态不同，分开合并
+        inflight_key = (provider_name, key, "stream")
+        if key is not None:
+            with self._lock:
+                shared = self._inflight.get(inflight_key)
+                if shared is None:
+                    shared = _SharedStream()
+                    self._inflight[inflight_key] = shared
+                    leader = True
+                else:
+                    leader = False
+            if not leader:
+                provider.count("coalesced")
+                return shared.reader()
+        else:
+            shared = _SharedStream()
+
+        provider.count("submitted")
+        try:
+            provider.acquire(session_id, self.queue_timeout)
+            try:
+                upstream = fn()
+            except Exception:
+                provider.release()
+                raise
+        except Exception as e:
+            # 领头请求没发出去：已挂在同一缓冲区上的请求也拿到同样的异常
+            provider.count("errors")
+            if key is not None:
+                self._finish(inflight_key)
+            shared.fail(e)
+            raise
+
+        def pump():
+            try:
+                shared.pump(upstream)
+            finally:
+                provider.release()
+                if key is not None:
+                    self._finish(inflight_key)
+
+        threading.Thread(target=pump, daemon=True).start()
+        return shared.reader()
+
+    def _finish(self, inflight_key):
+        with self._lock:
+            self._inflight.pop(inflight_key, None)
+
+    def summary(self):
+        with self._lock:
+            providers = dict(self._providers)
+            inflight = len(self._inflight)
+        return {"inflight_keys": inflight, "providers": {name: p.summary() for name, p in providers.items()}}
+
+    def prometheus_lines(self):
+        """给Telemetry的/metrics追加调度指标"""
+        lines = [
+            "# HELP pet_scheduler_queue_depth 各服务商排队中的请求数",
+            "# TYPE pet_scheduler_queue_depth gauge",
+        ]
+        summaries = self.summary()["providers"]
+        for name, s in sorted(summaries.items()):
+            lines.append(f'pet_scheduler_queue_depth{{provider="{name}"}} {s["queued"]}')
+        lines.append("# HELP pet_scheduler_active 各服务商执行中的请求数")
+        lines.append("# TYPE pet_scheduler_active gauge")
+        for name, s in sorted(summaries.items()):
+            lines.append(f'pet_scheduler_active{{provider="{name}"}} {s["active"]}')
+        lines.append("# HELP pet_scheduler_wait_seconds 最近请求的排队等待时间分位数")
+        lines.append("# TYPE pet_scheduler_wait_seconds gauge")
+        for name, s in sorted(summaries.items()):
+            lines.append(f'pet_scheduler_wait_seconds{{provider="{name}",quantile="0.5"}} {s["wait_p50"]:.6f}')
+            lines.append(f'pet_scheduler_wait_seconds{{provider="{name}",quantile="0.95"}} {s["wait_p95"]:.6f}')
+        for field in ("submitted", "coalesced", "timeouts", "cancelled", "errors"):
+            lines.append(f"# TYPE pet_scheduler_{field}_total counter")
+            for name, s in sorted(summaries.items()):
+                lines.append(f'pet_scheduler_{field}_total{{provider="{name}"}} {s[field]}')
+        return lines
@@ -0,0 +1,52 @@
+"""
+Streamlit脚本的启动/重跑耗时记录：
+- 进程第一次执行脚本的总耗时和其中顶部导入的耗时
+- 之后每次rerun的耗时（导入已在sys.modules里，主要是脚本本身）
+- 延迟导入的模块第一次被用到时的导入耗时，即纯文字会话省下的开销
+"""
+import importlib
+import sys
+import threading
+import time
+from collections import deque
+
+from telemetry import percentile
+
+
+class StartupProfile:
+    """进程级共享，线程安全"""
+
+    def __init__(self, max_runs=200):
+        self._lock = threading.Lock()
+        self.first_run = None  # {"imports": 秒, "total": 秒}
+        self.runs = deque(maxlen=max_runs)
+        self.lazy_loads = {}  # 模块名 -> 首次导入秒数
+
+    def lazy_import(self, name):
+        """按需导入模块；第一次真正导入时记下耗时"""
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        with self._lock:
+            self.lazy_loads.setdefault(name, time.perf_counter() - start)
+        return module
+
+    def record_run(self, import_seconds, total_seconds):
+        with self._lock:
+            if self.first_run is None:
+                self.first_run = {"imports": import_seconds, "total": total_seconds}
+            else:
+                self.runs.append(total_seconds)
+
+    def summary(self):
+        with self._lock:
+            runs = list(self.runs)
+            return {
+                "first_run": dict(self.first_run) if self.first_run else None,
+                "reruns": len(runs),
+                "rerun_p50": percentile(runs, 50) or 0.0,
+                "rerun_p95": percentile(runs, 95) or 0.0,
+                "lazy_loads": dict(self.lazy_loads),
+            }
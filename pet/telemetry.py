@@ -0,0 +1,231 @@
+"""
+每轮耗时埋点：录音 / 语音识别 / 大模型 / 语音合成 / 界面渲染 各阶段一个span。
+- span记录耗时和负载大小（图片字节、提示词token、音频字节）
+- 每轮结束追加一行到JSONL文件
+- 同时维护Prometheus文本格式的指标，可写文件，也可开一个HTTP端点给Prometheus抓取
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 直方图分桶（秒）
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 当前正在计时的span，annotate()往里面补负载信息
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def percentile(values, q):
+    """线性插值的分位数，q取0~100"""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def annotate(**payload):
+    """给当前span补充负载大小等字段；不在span里时什么也不做"""
+    span = _current_span.get()
+    if span is not None:
+        span["payload"].update(payload)
+
+
+def current_annotations():
+    """当前span已记录的字段（副本）；不在span里时返回空dict"""
+    span = _current_span.get()
+    return dict(span["payload"]) if span is not None else {}
+
+
+class Turn:
+    """一轮对话：按顺序收集各阶段span，finish()时交给Telemetry落盘"""
+
+    def __init__(self, telemetry, session_id, kind):
+        self.telemetry = telemetry
+        self.session_id = session_id
+        self.kind = kind
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        # record()补记的阶段里早于本轮开始的耗时，总耗时里要加上
+        self._recorded_seconds = 0.0
+        self.finished = False
+
+    @contextmanager
+    def span(self, stage, **payload):
+        record = {"stage": stage, "seconds": 0.0, "payload": dict(payload), "error": None}
+        token = _current_span.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            _current_span.reset(token)
+            self.spans.append(record)
+
+    def record(self, stage, seconds, started=None, **payload):
+        """
+        补记一个已在别处计好时的阶段（如历史消息的渲染）。
+        started为该阶段开始时的perf_counter()，早于本轮开始的那部分计入总耗时。
+        """
+        self.spans.append({"stage": stage, "seconds": seconds, "payload": payload, "error": None})
+        if started is not None and started < self._start:
+            self._recorded_seconds += min(seconds, self._start - started)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.telemetry.submit(self, time.perf_counter() - self._start + self._recorded_seconds)
+
+
+class Telemetry:
+    """进程级埋点汇总：所有会话共用，线程安全"""
+
+    def __init__(self, jsonl_path=None, prom_path=None, max_turns=500):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self._turns = deque(maxlen=max_turns)
+        # (stage) -> {"count", "sum", "buckets": [...], "errors"}；payload字段累加到 payload_totals
+        self._metrics = {}
+        self._payload_totals = {}
+        # 其他模块的指标（如请求调度器），render_prometheus时追加
+        self._collectors = []
+        self._server = None
+
+    def add_collector(self, collect_fn):
+        """collect_fn() 返回若干行Prometheus文本，随本模块的指标一起输出"""
+        self._collectors.append(collect_fn)
+
+    def start_turn(self, session_id, kind="text"):
+        return Turn(self, session_id, kind)
+
+    def submit(self, turn, total_seconds):
+        row = {
+            "ts": turn.started_at,
+            "session": turn.session_id,
+            "kind": turn.kind,
+            "total_seconds": round(total_seconds, 4),
+            "spans": [dict(span, seconds=round(span["seconds"], 4)) for span in turn.spans],
+        }
+        with self._lock:
+            self._turns.append(row)
+            for span in turn.spans:
+                self._observe(span)
+            if self.jsonl_path:
+                try:
+                    with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                except OSError:
+                    pass
+        if self.prom_path:
+            self.write_prometheus(self.prom_path)
+
+    def _observe(self, span):
+        metric = self._metrics.setdefault(span["stage"], {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS), "errors": 0})
+        metric["count"] += 1
+        metric["sum"] += span["seconds"]
+        for i, bound in enumerate(BUCKETS):
+            if span["seconds"] <= bound:
+                metric["buckets"][i] += 1
+        if span["error"]:
+            metric["errors"] += 1
+        for name, value in span["payload"].items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                key = (span["stage"], name)
+                self._payload_totals[key] = self._payload_totals.get(key, 0) + value
+
+    # ---------- 查询 ----------
+    def recent_turns(self, session_id=None, limit=10):
+        with self._lock:
+            turns = [t for t in self._turns if session_id is None or t["session"] == session_id]
+        return turns[-limit:]
+
+    def stage_percentiles(self, session_id=None, limit=None):
+        """返回 {阶段: {"p50", "p95", "count"}}，可只看某会话最近limit轮"""
+        turns = self.recent_turns(session_id, limit or self._turns.maxlen)
+        samples = {}
+        for turn in turns:
+            per_stage = {}
+            for span in turn["spans"]:
+                per_stage[span["stage"]] = per_stage.get(span["stage"], 0.0) + span["seconds"]
+            per_stage["total"] = turn["total_seconds"]
+            for stage, seconds in per_stage.items():
+                samples.setdefault(stage, []).append(seconds)
+        return {
+            stage: {"p50": percentile(values, 50), "p95": percentile(values, 95), "count": len(values)}
+            for stage, values in samples.items()
+        }
+
+    # ---------- Prometheus ----------
+    def render_prometheus(self):
+        lines = [
+            "# HELP pet_stage_seconds 每轮各阶段耗时",
+            "# TYPE pet_stage_seconds histogram",
+        ]
+        with self._lock:
+            metrics = {stage: dict(m, buckets=list(m["buckets"])) for stage, m in self._metrics.items()}
+            payload_totals = dict(self._payload_totals)
+        for stage, m in sorted(metrics.items()):
+            for bound, count in zip(BUCKETS, m["buckets"]):
+                lines.append(f'pet_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'pet_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {m["count"]}')
+            lines.append(f'pet_stage_seconds_sum{{stage="{stage}"}} {m["sum"]:.6f}')
+            lines.append(f'pet_stage_seconds_count{{stage="{stage}"}} {m["count"]}')
+        lines.append("# HELP pet_stage_errors_total 各阶段抛出异常的次数")
+        lines.append("# TYPE pet_stage_errors_total counter")
+        for stage, m in sorted(metrics.items()):
+            lines.append(f'pet_stage_errors_total{{stage="{stage}"}} {m["errors"]}')
+        lines.append("# HELP pet_stage_payload_total 各阶段负载累计（字节数、token数等）")
+        lines.append("# TYPE pet_stage_payload_total counter")
+        for (stage, name), value in sorted(payload_totals.items()):
+            lines.append(f'pet_stage_payload_total{{stage="{stage}",field="{name}"}} {value}')
+        for collect_fn in self._collectors:
+            lines.extend(collect_fn())
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """写到临时文件再替换，供node_exporter的textfile collector读取"""
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def serve_prometheus(self, port, host="0.0.0.0"):
+        """后台线程开一个 /metrics 端点；重复调用只启动一次"""
+        if self._server is not None:
+            return self._server
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = telemetry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
@@ -0,0 +1,150 @@
+"""语音合成结果缓存：按文本+发音参数做内容寻址，内存LRU + 限容量磁盘层"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".tts_cache")
+
+
+def make_tts_key(text, options, lang='zh', ctp=1):
+    """文本和全部影响音频的参数（per/spd/pit/vol/aue等）一起算哈希"""
+    payload = json.dumps(
+        {"text": text, "lang": lang, "ctp": ctp, "options": options},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """两级LRU缓存：热数据放内存，全部数据落盘，超出容量按最久未用淘汰"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_disk_bytes=200 * 1024 * 1024,
+                 max_memory_bytes=32 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> 文件大小，按访问先后排序
+        self._disk_bytes = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def _load_disk_index(self):
+        """启动时按修改时间重建磁盘层的LRU顺序"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".mp3"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _remember(self, key, audio):
+        """放入内存层并按容量淘汰"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        if len(audio) > self.max_memory_bytes:
+            return
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key):
+        """命中返回音频bytes，未命中返回None"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return audio
+            if key not in self._disk:
+                self.stats["misses"] += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    audio = f.read()
+                # 更新修改时间，重启后仍能还原LRU顺序
+                os.utime(path)
+            except OSError:
+                self._disk_bytes -= self._disk.pop(key)
+                self.stats["misses"] += 1
+                return None
+            self._disk.move_to_end(key)
+            self._remember(key, audio)
+            self.stats["disk_hits"] += 1
+            return audio
+
+    def put(self, key, audio):
+        with self._lock:
+            self._remember(key, audio)
+            if key in self._disk:
+                self._disk.move_to_end(key)
+                return
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(audio)
+                os.replace(tmp_path, path)
+            except OSError:
+                # 写一半或改名失败时删掉临时文件，不在缓存目录里留垃圾
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                return
+            self._disk[key] = len(audio)
+            self._disk_bytes += len(audio)
+            self._evict_disk()
+
+    def get_or_synthesize(self, text, options, synthesize_fn):
+        """命中直接返回，不命中才调用synthesize_fn；失败结果（dict）不缓存"""
+        key = make_tts_key(text, options)
+        audio = self.get(key)
+        if audio is not None:
+            return audio
+        result = synthesize_fn(text, options)
+        if not isinstance(result, dict):
+            self.put(key, result)
+        return result
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, disk_bytes=self._disk_bytes, disk_entries=len(self._disk),
+                        memory_bytes=self._memory_bytes, hit_rate=self.hit_rate())
@@ -0,0 +1,96 @@
+"""百度语音合成流水线：按句切分 + 有界线程池并发合成 + 按原顺序交付"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# 百度短文本合成单次上限约1024字节（GBK），中文按500字切分
+MAX_SEGMENT_LEN = 500
+# 默认并发数，免费额度QPS较低，不宜过大
+DEFAULT_MAX_WORKERS = 4
+# 发音人 -> 百度per参数
+VOICE_PERSONS = {"女声（默认）": 0, "男声": 1, "情感女声": 3, "情感男声": 4}
+
+# 句末标点：中文句号/问号/叹号/分号/省略号，以及后面跟空白或结尾的英文句末标点
+_SENTENCE_END = re.compile(r'[。！？；…]+[”’"\'）)」』]*|[.!?;]+[”’"\'）)」』]*(?=\s|$)')
+# 句子过长时退而求其次的断点：逗号、顿号、冒号、空白
+_SOFT_BREAK = re.compile(r'[，,、：:]|\s')
+
+
+class SynthesisError(Exception):
+    """某一段语音合成失败"""
+
+    def __init__(self, index, err_msg):
+        super().__init__(err_msg)
+        self.index = index
+        self.err_msg = err_msg
+
+
+def split_sentences(text):
+    """按中英文句末标点切句，保留原有空白，拼接后与原文完全一致"""
+    sentences = []
+    start = 0
+    for m in _SENTENCE_END.finditer(text):
+        sentences.append(text[start:m.end()])
+        start = m.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+def _split_long_sentence(sentence, max_len):
+    """超长句子优先在逗号/空白处断开，实在没有断点才硬切"""
+    pieces = []
+    while len(sentence) > max_len:
+        window = sentence[:max_len]
+        cut = max((m.end() for m in _SOFT_BREAK.finditer(window)), default=0)
+        if cut == 0:
+            cut = max_len
+        pieces.append(sentence[:cut])
+        sentence = sentence[cut:]
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def split_text_for_tts(text, max_len=MAX_SEGMENT_LEN):
+    """把文本切成不超过max_len的段，尽量在句子边界处断开"""
+    segments = []
+    current = ""
+    for sentence in split_sentences(text):
+        pieces = _split_long_sentence(sentence, max_len) if len(sentence) > max_len else [sentence]
+        for piece in pieces:
+            if current and len(current) + len(piece) > max_len:
+                segments.append(current)
+                current = ""
+            current += piece
+    if current:
+        segments.append(current)
+    return [seg.strip() for seg in segments if seg.strip()]
+
+
+def synthesize_segments(segments, synthesize_fn, max_workers=DEFAULT_MAX_WORKERS, on_segment=None):
+    """
+    并发合成各段语音，按原顺序返回音频列表。
+    synthesize_fn(segment) 返回音频bytes，失败时返回百度的错误dict；
+    on_segment(idx, audio) 在调用方线程中按顺序回调，前面的段一就绪就交给播放器。
+    """
+    if not segments:
+        return []
+
+    audio_segments = []
+    futures = []
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(segments))))
+    try:
+        futures = [pool.submit(synthesize_fn, seg) for seg in segments]
+        for idx, future in enumerate(futures):
+            result = future.result()
+            if isinstance(result, dict):
+                raise SynthesisError(idx, result.get('err_msg', '未知错误'))
+            audio_segments.append(result)
+            if on_segment:
+                on_segment(idx, result)
+    finally:
+        # 出错时取消尚未开始的段，不再浪费配额（逐个cancel，不用3.9才有的shutdown(cancel_futures=True)）
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=True)
+    return audio_segments
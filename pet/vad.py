@@ -0,0 +1,122 @@
+"""基于能量的语音活动检测（VAD）：分块读入int16音频，说完话静音一段时间后自动停止录音"""
+import numpy as np
+
+
+def frame_rms(frame):
+    """单帧均方根能量（int16幅度）"""
+    if len(frame) == 0:
+        return 0.0
+    samples = frame.astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples)))
+
+
+class EnergyVAD:
+    """
+    逐帧喂入int16音频：
+    - 开头几帧估计环境噪声，阈值 = max(min_threshold, 噪声 × noise_ratio)；
+      能量达到 min_threshold × noise_ratio 的帧不当噪声，一开口就说话时阈值不会被语音本身抬高
+    - 检测到语音后，连续静音超过silence_ms即结束
+    - 结果去掉首尾静音，只在语音前后各保留padding_ms
+    不依赖录音设备，直接喂numpy数组即可离线测试。
+    """
+
+    def __init__(self, samplerate=16000, frame_ms=30, silence_ms=800, max_duration=10,
+                 min_speech_ms=150, padding_ms=200, noise_ratio=3.0, min_threshold=300.0,
+                 calibration_frames=5):
+        self.samplerate = samplerate
+        self.frame_len = int(samplerate * frame_ms / 1000)
+        self.frame_ms = frame_ms
+        self.silence_frames = max(1, int(silence_ms / frame_ms))
+        self.max_frames = int(max_duration * 1000 / frame_ms)
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.padding_frames = int(padding_ms / frame_ms)
+        self.noise_ratio = noise_ratio
+        self.min_threshold = min_threshold
+        self.calibration_frames = calibration_frames
+        self.reset()
+
+    def reset(self):
+        self.frames = []
+        self.energies = []
+        self.noise_floor = None
+        self.first_speech = None
+        self.last_speech = None
+        self.speech_frames = 0
+        self.finished = False
+
+    @property
+    def threshold(self):
+        if self.noise_floor is None:
+            return self.min_threshold
+        return max(self.min_threshold, self.noise_floor * self.noise_ratio)
+
+    def feed(self, frame):
+        """喂入一帧（一维int16数组），返回True表示应停止录音"""
+        if self.finished:
+            return True
+        frame = np.asarray(frame, dtype=np.int16).reshape(-1)
+        energy = frame_rms(frame)
+        idx = len(self.frames)
+        self.frames.append(frame)
+        self.energies.append(energy)
+
+        # 还没开始说话时用开头几帧估计噪声，明显是语音的帧不参与
+        if self.first_speech is None and idx < self.calibration_frames:
+            calib = [e for e in self.energies[:idx + 1] if e < self.min_threshold * self.noise_ratio]
+            self.noise_floor = float(np.median(calib)) if calib else None
+
+        if energy >= self.threshold:
+            self.speech_frames += 1
+            if self.first_speech is None:
+                self.first_speech = idx
+            self.last_speech = idx
+        elif self.first_speech is not None and self.speech_frames < self.min_speech_frames \
+                and idx - self.last_speech > self.silence_frames:
+            # 太短的能量尖峰（咳嗽、敲桌子）不算开始说话
+            self.first_speech = None
+            self.last_speech = None
+            self.speech_frames = 0
+
+        heard_speech = self.speech_frames >= self.min_speech_frames
+        if heard_speech and idx - self.last_speech >= self.silence_frames:
+            self.finished = True
+        elif len(self.frames) >= self.max_frames:
+            self.finished = True
+        return self.finished
+
+    @property
+    def has_speech(self):
+        return self.speech_frames >= self.min_speech_frames
+
+    def result(self):
+        """返回去掉首尾静音后的int16音频；没检测到语音时返回空数组"""
+        if not self.has_speech:
+            return np.zeros(0, dtype=np.int16)
+        start = max(0, self.first_speech - self.padding_frames)
+        end = min(len(self.frames), self.last_speech + 1 + self.padding_frames)
+        return np.concatenate(self.frames[start:end])
+
+
+def run_vad_on_buffer(audio, vad):
+    """离线模式：把整段音频按帧喂给VAD，返回（裁剪后的音频, 实际消耗的采样数）"""
+    audio = np.asarray(audio, dtype=np.int16).reshape(-1)
+    consumed = 0
+    for start in range(0, len(audio), vad.frame_len):
+        frame = audio[start:start + vad.frame_len]
+        consumed = start + len(frame)
+        if vad.feed(frame):
+            break
+    return vad.result(), consumed
+
+
+def record_with_vad(vad, input_stream_factory):
+    """
+    实时模式：从录音流逐帧读取，直到VAD判定结束。
+    input_stream_factory(samplerate, blocksize) 返回可用with打开、带read(n)方法的流（如sounddevice.InputStream）
+    """
+    with input_stream_factory(vad.samplerate, vad.frame_len) as stream:
+        while True:
+            data, _ = stream.read(vad.frame_len)
+            if vad.feed(data[:, 0] if data.ndim > 1 else data):
+                break
+    return vad.result()
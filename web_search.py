@@ -1,34 +1,191 @@
-from zai import ZhipuAiClient
-
-# 初始化客户端
-client = ZhipuAiClient(api_key="")
-
-# 使用网络搜索工具
-response = client.chat.completions.create(
-    model='glm-4.7',
-    messages=[
-        {'role': 'system', 'content': 'You are a helpful assistant.'},
-        {'role': 'user', 'content': '英超联赛最新排名榜，给我讲一下，条理清晰，分行输出，前10名就好'},
-    ],
-    tools=[
-        {
-            'type': 'web_search',
-            'web_search': {
-                'search_query': '英超联赛最新排名榜',
-                'search_result': True,
-            },
-        }
-    ],
-    temperature=0.5,
-    max_tokens=2000,
-)
-
-# 获取响应内容并写入文件
-text = response.choices[0].message.content
-print(type(text))
-with open('英超联赛排名.txt', 'w', encoding='utf-8') as f:
-    f.write(text)
-
-print("内容已保存到 英超联赛排名.txt 文件中")
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# 复用pet目录下的统一大模型客户端（连接复用、超时、重试、并发上限）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "pet"))
+from llm_client import get_llm_client
 
+# 初始化客户端（API Key 从环境变量 ZHIPU_API_KEY 读取）
+client = get_llm_client()
+
+MODEL = 'glm-4.7'
+DEFAULT_QUERY = '英超联赛最新排名榜'
+DEFAULT_PROMPT = '英超联赛最新排名榜，给我讲一下，条理清晰，分行输出，前10名就好'
+DEFAULT_OUTPUT = '英超联赛排名.txt'
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".search_cache")
+
+
+class SearchCache:
+    """按（查询词, 提问, 模型）落盘缓存搜索结果，超过TTL秒视为过期；线程安全"""
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=3600):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, query, prompt):
+        payload = json.dumps([query, prompt, MODEL], ensure_ascii=False)
+        return os.path.join(self.cache_dir, hashlib.sha256(payload.encode('utf-8')).hexdigest() + ".json")
+
+    def get(self, query, prompt):
+        path = self._path(query, prompt)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            if time.time() - entry["time"] > self.ttl:
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+        return entry["text"]
+
+    def put(self, query, prompt, text):
+        path = self._path(query, prompt)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"time": time.time(), "query": query, "text": text}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def web_search(query, prompt):
+    """使用网络搜索工具提问，返回回复文本"""
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=[
+            {'role': 'system', 'content': 'You are a helpful assistant.'},
+            {'role': 'user', 'content': prompt},
+        ],
+        tools=[
+            {
+                'type': 'web_search',
+                'web_search': {
+                    'search_query': query,
+                    'search_result': True,
+                },
+            }
+        ],
+        temperature=0.5,
+        max_tokens=2000,
+    )
+    return response.choices[0].message.content
+
+
+def cached_search(cache, query, prompt):
+    """返回（回复文本, 是否命中缓存, 耗时秒数）"""
+    start = time.perf_counter()
+    text = cache.get(query, prompt) if cache else None
+    if text is not None:
+        return text, True, time.perf_counter() - start
+    text = web_search(query, prompt)
+    if cache:
+        cache.put(query, prompt, text)
+    return text, False, time.perf_counter() - start
+
+
+# ------------------------------
+# 批量模式：多个查询并发搜索，结果逐条写出
+# ------------------------------
+def load_queries(path):
+    """每行一个查询词，或JSONL：{"query": ..., "prompt": ...}"""
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                row = json.loads(line)
+                queries.append((row["query"], row.get("prompt") or default_prompt(row["query"])))
+            else:
+                queries.append((line, default_prompt(line)))
+    return queries
+
+
+def default_prompt(query):
+    return f'{query}，给我讲一下，条理清晰，分行输出'
+
+
+def safe_filename(query):
+    # 截断后的长查询可能同名，加上完整查询的短哈希区分
+    name = re.sub(r'[\\/:*?"<>|\s]+', '_', query).strip('_')[:60] or "query"
+    digest = hashlib.sha256(query.encode('utf-8')).hexdigest()[:8]
+    return f"{name}_{digest}"
+
+
+def run_batch(queries, cache, workers=4, out_jsonl=None, out_dir=None):
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    jsonl_file = open(out_jsonl, 'a', encoding='utf-8') if out_jsonl else None
+    done = failed = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(cached_search, cache, query, prompt): (query, prompt) for query, prompt in queries}
+            for future in as_completed(futures):
+                query, prompt = futures[future]
+                try:
+                    text, hit, seconds = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ {query}：{e}", file=sys.stderr)
+                    continue
+                done += 1
+                # 每完成一个就写出，中途中断也不丢已完成的结果
+                if jsonl_file:
+                    jsonl_file.write(json.dumps({"query": query, "prompt": prompt, "text": text, "cached": hit,
+                                                 "seconds": round(seconds, 3)}, ensure_ascii=False) + "\n")
+                    jsonl_file.flush()
+                if out_dir:
+                    with open(os.path.join(out_dir, f"{safe_filename(query)}.txt"), 'w', encoding='utf-8') as f:
+                        f.write(text)
+                print(f"[{done + failed}/{len(queries)}] {'缓存' if hit else '搜索'} {seconds:.2f}秒  {query}")
+    finally:
+        if jsonl_file:
+            jsonl_file.close()
+    elapsed = time.perf_counter() - start
+    print(f"完成 {done} 个，失败 {failed} 个，用时 {elapsed:.1f} 秒")
+    if cache:
+        total = cache.stats["hits"] + cache.stats["misses"]
+        rate = cache.stats["hits"] / total if total else 0.0
+        print(f"缓存命中 {cache.stats['hits']} / 未命中 {cache.stats['misses']}（其中过期 {cache.stats['expired']}），命中率 {rate:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries", nargs="*", help="查询词；不给且没有--queries-file时搜索默认的英超排名")
+    parser.add_argument("--queries-file", help="每行一个查询词，或JSONL（query/prompt字段）")
+    parser.add_argument("--workers", type=int, default=4, help="同时进行的搜索数")
+    parser.add_argument("--ttl", type=int, default=int(os.getenv("SEARCH_CACHE_TTL", "3600")), help="缓存有效期（秒），0表示不用缓存")
+    parser.add_argument("--out-jsonl", help="批量结果追加写入的JSONL文件")
+    parser.add_argument("--out-dir", help="每个查询写一个txt文件的目录")
+    args = parser.parse_args()
+
+    cache = SearchCache(ttl=args.ttl) if args.ttl > 0 else None
+    queries = [(q, default_prompt(q)) for q in args.queries]
+    if args.queries_file:
+        queries += load_queries(args.queries_file)
+    # 同一批里重复的查询只搜一次
+    queries = list(dict.fromkeys(queries))
+
+    if queries:
+        run_batch(queries, cache, args.workers, args.out_jsonl, args.out_dir or (None if args.out_jsonl else "search_results"))
+    else:
+        # 原来的单次用法：搜索英超排名并写入文件
+        text, hit, _ = cached_search(cache, DEFAULT_QUERY, DEFAULT_PROMPT)
+        with open(DEFAULT_OUTPUT, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"内容已保存到 {DEFAULT_OUTPUT} 文件中{'（来自缓存）' if hit else ''}")